@@ -1,79 +1,197 @@
-from flask import Flask, render_template, request, jsonify, send_file, make_response
+from flask import Flask, Request, g, render_template, stream_template, request, jsonify, send_file, make_response, Response
+from werkzeug.exceptions import HTTPException
 from werkzeug.utils import secure_filename
-from PIL import Image
+import logging
 import os
 import tempfile
+import time
 import uuid
-from datetime import datetime
-from image_captioner import ImageCaptioner
-from description_generator import DescriptionGenerator
+import config
+from pipeline import image_store, history_store
+import pipeline
+from history_store import migrate_json_history
+from jobs import create_job_queue
+from model_server import ModelServerPool
+from presets import DECODING_PRESETS
+from pdf_generator import ReportEngine
+from description_generator import SEVERITY_ORDER
+from ingest import stage_upload, verify_image
+from metrics import REQUEST_SECONDS, dump_profile, registry, span, start_profile
 import json
-import base64
-import cv2
-from io import BytesIO
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
-from reportlab.lib.utils import ImageReader
-from textwrap import wrap  # ✅ for text wrapping
+import multiprocessing
+import re
+import shutil
+import threading
+import zipfile
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(process)d %(name)s %(levelname)s %(message)s')
+logger = logging.getLogger(__name__)
+
+# Uploads stay in memory up to this size and spill to a temp file above it
+UPLOAD_SPILL_THRESHOLD = int(os.environ.get('UPLOAD_SPILL_THRESHOLD', 8 * 1024 * 1024))
+
+class UploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPILL_THRESHOLD)
 
 app = Flask(__name__)
+app.request_class = UploadRequest
 app.secret_key = 'your-secret-key-here-make-it-random'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
+# History pagination
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 200
+HISTORY_DISPLAY_COLUMNS = ('date', 'damage_type', 'image_caption', 'loss_description')
+
+# Multi-claim PDF reports
+REPORT_MAX_CLAIMS = 1000
+REPORT_COLUMNS = ('date', 'damage_type', 'loss_description', 'image_hash', 'image_data')
+
+# Job status polling interval for server-sent events, and how long one
+# stream stays open before the client has to reconnect
+JOB_EVENT_INTERVAL = 0.5
+JOB_EVENT_MAX_SECONDS = 60
+JOB_EVENT_RETRY_MS = 1000
+# Each open stream holds a web thread; past this many per web process,
+# /jobs/<id>/events answers 503 and clients poll /jobs/<id> instead
+JOB_EVENT_MAX_STREAMS = int(os.environ.get('JOB_EVENT_MAX_STREAMS', 2))
+job_event_streams = threading.BoundedSemaphore(JOB_EVENT_MAX_STREAMS)
+
+# Variants /images/<hash>?variant= serves, each with the blobs tried in
+# order (None is the original, kept only when archived)
+IMAGE_VARIANT_FALLBACKS = {
+    'original': (None, 'pdf'),
+    'pdf': ('pdf', None),
+    'thumb': ('thumb', 'pdf', None),
+    'model': ('model', None),
+}
+
 # Allowed file extensions
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 
-# Initialize models (cached)
-captioner = None
-desc_generator = None
-
-# Ensure upload and history directories exist
-os.makedirs('uploads', exist_ok=True)
+# Ensure the data directory exists
 os.makedirs('data', exist_ok=True)
+registry.prune()
+
+migrate_json_history(config.HISTORY_FILE, history_store, image_store)
 
-HISTORY_FILE = 'data/detection_history.json'
+if config.MODEL_PRELOAD and not config.MODEL_SERVER:
+    pipeline.load_models()
 
-# Initialize history file if it doesn't exist
-if not os.path.exists(HISTORY_FILE):
-    with open(HISTORY_FILE, 'w') as f:
-        json.dump([], f)
+# Start the job workers now so models load and warm up before the first upload.
+# Spawned children re-import this module when the app runs as `python app.py`;
+# they must not start a pool of their own.
+job_queue = create_job_queue()
+report_engine = ReportEngine(image_store)
+model_servers = ModelServerPool(supervise_interval=config.MODEL_SERVER_SUPERVISE_INTERVAL)
+if multiprocessing.parent_process() is None:
+    if config.MODEL_SERVER and config.MODEL_SERVER_START:
+        model_servers.start()
+    job_queue.start()
+registry.gauge('claiminsight_job_queue_depth', 'Upload jobs waiting for a worker', callback=job_queue.queue_depth)
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def get_models():
-    """Initialize models only when needed"""
-    global captioner, desc_generator
-    if captioner is None or desc_generator is None:
-        captioner = ImageCaptioner()
-        desc_generator = DescriptionGenerator()
-    return captioner, desc_generator
+@app.before_request
+def start_request_timer():
+    # Started lazily: threads from before gunicorn forks do not survive the fork
+    registry.start_flusher()
+    g.started = time.perf_counter()
+    g.profiler = start_profile()
 
-def load_history():
-    try:
-        with open(HISTORY_FILE, 'r') as f:
-            return json.load(f)
-    except:
-        return []
+@app.after_request
+def record_request(response):
+    """
+    Record request latency. after_request runs before a streamed body is
+    iterated, so streamed responses are timed, and profiled, until the
+    server closes them after the last chunk.
+    """
+    started = g.pop('started', None)
+    profiler = g.pop('profiler', None)
+    endpoint = request.endpoint or 'unknown'
+    labels = {'endpoint': endpoint, 'method': request.method, 'status': response.status_code}
 
-def save_history(history):
-    with open(HISTORY_FILE, 'w') as f:
-        json.dump(history, f)
+    def finish():
+        if started is not None:
+            REQUEST_SECONDS.observe(time.perf_counter() - started, **labels)
+        if profiler is not None:
+            profiler.disable()
+            dump_profile(profiler, f"request-{endpoint}")
 
-def add_to_history(entry):
-    history = load_history()
-    history.append(entry)
-    save_history(history)
+    if response.is_streamed:
+        response.call_on_close(finish)
+    else:
+        finish()
+    return response
 
 @app.route('/')
 def home():
     return render_template('index.html')
 
+def history_query_args():
+    """Read cursor, page size and filters for history listings from the query string"""
+    cursor = request.args.get('cursor', type=int)
+    limit = request.args.get('limit', HISTORY_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+    date_to = request.args.get('date_to', '')
+    if len(date_to) == 10:
+        # A bare YYYY-MM-DD includes the whole day
+        date_to += ' 23:59:59'
+    return {
+        'before_id': cursor,
+        'limit': limit,
+        'damage_type': request.args.get('damage_type', ''),
+        'date_from': request.args.get('date_from', ''),
+        'date_to': date_to,
+    }
+
 @app.route('/history')
 def history():
-    history_data = load_history()
-    history_data.reverse()  # Show most recent first
-    return render_template('history.html', history=history_data)
+    query = history_query_args()
+    page = history_store.page(HISTORY_DISPLAY_COLUMNS, **query)
+    return Response(stream_template(
+        'history.html',
+        history=page,
+        damage_types=history_store.damage_types(),
+        filters=request.args
+    ))
+
+@app.route('/api/history')
+def history_api():
+    query = history_query_args()
+    page = history_store.page(HISTORY_DISPLAY_COLUMNS, **query)
+    entries = list(page)
+    return jsonify({
+        'entries': entries,
+        'next_cursor': page.next_cursor,
+        'has_more': page.has_more
+    })
+
+@app.route('/api/search')
+def search_api():
+    """
+    Ranked text search (q) over captions and descriptions with damage type,
+    severity and date filters, facet counts (facets=0 skips them) and
+    cursor pagination
+    """
+    query = history_query_args()
+    severity = request.args.get('severity', '')
+    if severity and severity not in SEVERITY_ORDER:
+        return jsonify({'error': f"Unknown severity. Choose one of: {', '.join(SEVERITY_ORDER)}."}), 400
+    result = history_store.search(
+        request.args.get('q', ''),
+        limit=query['limit'],
+        cursor=query['before_id'],
+        damage_type=query['damage_type'],
+        severity=severity,
+        date_from=query['date_from'],
+        date_to=query['date_to'],
+        facets=request.args.get('facets', '1') != '0'
+    )
+    result['has_more'] = result['next_cursor'] is not None
+    return jsonify(result)
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
@@ -85,179 +203,290 @@ def upload_file():
         file = request.files['file']
         damage_type = request.form.get('damage_type', 'Unknown Damage')
         custom_damage = request.form.get('custom_damage', '')
+        preset = request.form.get('preset') or None
+        archive_original = config.ARCHIVE_ORIGINALS or request.form.get('archive_original') == '1'
         
         if file.filename == '':
             return jsonify({'error': 'No file selected'}), 400
         
+        if preset and preset not in DECODING_PRESETS:
+            return jsonify({'error': f"Unknown preset. Choose one of: {', '.join(DECODING_PRESETS)}."}), 400
+        
         if file and allowed_file(file.filename):
-            # Generate unique filename
-            file_id = str(uuid.uuid4())
             filename = secure_filename(file.filename)
-            temp_path = os.path.join('uploads', f"{file_id}_{filename}")
-            file.save(temp_path)
+            with span('upload', 'read'):
+                data = file.read()
             
             # Validate image
             try:
-                with Image.open(temp_path) as img:
-                    img.verify()
+                with span('upload', 'verify'):
+                    verify_image(data)
             except Exception:
-                os.remove(temp_path)
                 return jsonify({'error': 'Invalid image file'}), 400
             
-            # Load models
-            captioner, desc_generator = get_models()
-            
-            # Process image
-            image_caption = captioner.generate_caption(temp_path)
+            # Only hash and store the bytes here; the job decodes them and
+            # builds the model input, thumbnail and PDF variants
+            with span('upload', 'stage'):
+                image_hash = stage_upload(image_store, data)
             
             # Use custom damage type if provided
             final_damage_type = custom_damage if custom_damage else damage_type
             
-            # Generate description
-            loss_description = desc_generator.enhance_description(image_caption, final_damage_type)
+            # Caption, describe and persist in the background
+            with span('upload', 'enqueue'):
+                job_id = job_queue.submit({
+                    'image_hash': image_hash,
+                    'damage_type': final_damage_type,
+                    'filename': filename,
+                    'preset': preset,
+                    'archive_original': archive_original
+                })
             
-            # Store original image data in base64 format
-            image = cv2.imread(temp_path)
-            _, buffer = cv2.imencode('.jpg', image)
-            image_data = base64.b64encode(buffer).decode('utf-8')
-            
-            # Create result data
-            result_data = {
+            return jsonify({
                 'success': True,
-                'image_caption': image_caption,
-                'damage_type': final_damage_type,
-                'loss_description': loss_description,
-                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                'filename': filename,
-                'image_data': image_data
-            }
-            
-            # Add to history
-            history_entry = {
-                'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                'damage_type': final_damage_type,
-                'image_caption': image_caption,
-                'loss_description': loss_description,
-                'image_data': image_data
-            }
-            add_to_history(history_entry)
-            
-            # Clean up temporary file
-            os.remove(temp_path)
-            
-            return jsonify(result_data)
+                'job_id': job_id,
+                'status_url': f"/jobs/{job_id}",
+                'events_url': f"/jobs/{job_id}/events"
+            }), 202
         
         else:
             return jsonify({'error': 'Invalid file type. Please upload PNG, JPG, or JPEG.'}), 400
             
+    except HTTPException:
+        raise  # e.g. 413 from parsing the body, answered by its error handler
     except Exception as e:
         return jsonify({'error': f'Processing error: {str(e)}'}), 500
 
+@app.route('/upload/batch', methods=['POST'])
+def upload_batch():
+    """Accept a ZIP archive or a multipart set of images and ingest them as a job on the worker pool"""
+    try:
+        request.max_content_length = config.BATCH_MAX_CONTENT_LENGTH
+        archive = request.files.get('archive')
+        # Files of other types are kept so the batch records an error for each
+        files = [f for f in request.files.getlist('files') if f.filename]
+        damage_type = request.form.get('custom_damage') or request.form.get('damage_type', 'Unknown Damage')
+        
+        if not archive and not files:
+            return jsonify({'error': 'No images selected'}), 400
+        
+        batch_id = uuid.uuid4().hex
+        batch_dir = os.path.join(config.BATCH_DIR, batch_id)
+        os.makedirs(batch_dir)
+        if archive:
+            source = os.path.join(batch_dir, 'archive.zip')
+            archive.save(source)
+            if not zipfile.is_zipfile(source):
+                shutil.rmtree(batch_dir)
+                return jsonify({'error': 'The archive is not a ZIP file'}), 400
+        else:
+            source = os.path.join(batch_dir, 'images')
+            os.makedirs(source)
+            for index, file in enumerate(files):
+                file.save(os.path.join(source, f"{index:05d}_{secure_filename(file.filename)}"))
+        
+        job_queue.submit({
+            'kind': 'batch',
+            'source': source,
+            'results_path': os.path.join(batch_dir, 'results.jsonl'),
+            'damage_type': damage_type,
+            'batch_size': config.INGEST_BATCH_SIZE
+        }, job_id=batch_id)
+        
+        return jsonify({
+            'success': True,
+            'batch_id': batch_id,
+            'status_url': f"/upload/batch/{batch_id}",
+            'results_url': f"/upload/batch/{batch_id}/results"
+        }), 202
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        return jsonify({'error': f'Batch upload error: {str(e)}'}), 500
+
+def batch_paths(batch_id):
+    if not re.fullmatch(r'[0-9a-f]{32}', batch_id):
+        return None
+    batch_dir = os.path.join(config.BATCH_DIR, batch_id)
+    if not os.path.isdir(batch_dir):
+        return None
+    return os.path.join(batch_dir, 'results.jsonl'), os.path.join(batch_dir, 'results.jsonl.summary.json')
+
+@app.route('/upload/batch/<batch_id>')
+def batch_status(batch_id):
+    paths = batch_paths(batch_id)
+    if paths is None:
+        return jsonify({'error': 'Batch not found'}), 404
+    results_path, summary_path = paths
+    
+    if os.path.exists(summary_path):
+        with open(summary_path, 'r') as f:
+            return jsonify({'batch_id': batch_id, 'status': 'done', 'summary': json.load(f)})
+    # The job row is pruned some time after the batch finished
+    job = job_queue.job_store.get(batch_id)
+    status = job['status'] if job else 'running'
+    
+    counts = {'ok': 0, 'error': 0}
+    if os.path.exists(results_path):
+        with open(results_path, 'r') as f:
+            for line in f:
+                try:
+                    counts[json.loads(line)['status']] += 1
+                except (ValueError, KeyError):
+                    continue  # record still being written
+    response = {'batch_id': batch_id, 'status': status, 'processed': counts['ok'], 'errors': counts['error']}
+    if job and job['error']:
+        response['error'] = job['error']
+    return jsonify(response)
+
+@app.route('/upload/batch/<batch_id>/results')
+def batch_results(batch_id):
+    paths = batch_paths(batch_id)
+    if paths is None or not os.path.exists(paths[0]):
+        return jsonify({'error': 'Batch not found'}), 404
+    return send_file(paths[0], mimetype='application/x-ndjson', as_attachment=True, download_name=f"batch_{batch_id}.jsonl")
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_queue.job_store.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """
+    Server-sent events with the job's state on every change, until it
+    finishes. Each stream holds a web thread, so it is closed after
+    JOB_EVENT_MAX_SECONDS and EventSource reconnects, and at most
+    JOB_EVENT_MAX_STREAMS are open per web process. An unknown job gets a
+    'failed' event instead of a stream. The browser client polls /jobs/<id>.
+    """
+    if not job_event_streams.acquire(blocking=False):
+        response = jsonify({'error': 'Too many event streams, poll the status URL instead',
+                            'status_url': f"/jobs/{job_id}"})
+        response.headers['Retry-After'] = str(JOB_EVENT_MAX_SECONDS)
+        return response, 503
+
+    def events():
+        deadline = time.monotonic() + JOB_EVENT_MAX_SECONDS
+        yield f"retry: {JOB_EVENT_RETRY_MS}\n\n"
+        last = None
+        while True:
+            job = job_queue.job_store.get(job_id)
+            if job is None:
+                unknown = {'id': job_id, 'status': 'failed', 'error': 'Job not found'}
+                yield f"event: failed\ndata: {json.dumps(unknown)}\n\n"
+                return
+            state = (job['status'], job['stage'])
+            if state != last:
+                yield f"event: {job['status']}\ndata: {json.dumps(job)}\n\n"
+                last = state
+            if job['status'] in ('done', 'failed') or time.monotonic() >= deadline:
+                return
+            time.sleep(JOB_EVENT_INTERVAL)
+
+    response = Response(events(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    # Runs even when the client leaves before the stream starts
+    response.call_on_close(job_event_streams.release)
+    return response
+
+@app.route('/ready')
+def ready():
+    """Readiness probe: 200 once a job worker has warmed-up models"""
+    if job_queue.ready():
+        return jsonify({'ready': True})
+    return jsonify({'ready': False}), 503
+
+@app.route('/metrics')
+def metrics():
+    """
+    Prometheus metrics merged across web and job worker processes; the
+    caption batcher and cache only run in the job workers
+    """
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/images/<image_hash>')
+def get_image(image_hash):
+    """Serve a stored image variant; blobs are immutable so the hash doubles as ETag"""
+    requested = request.args.get('variant', 'original')
+    if requested not in IMAGE_VARIANT_FALLBACKS:
+        return jsonify({'error': f"Unknown variant. Choose one of: {', '.join(IMAGE_VARIANT_FALLBACKS)}."}), 400
+    try:
+        variant, path = image_store.find(image_hash, *IMAGE_VARIANT_FALLBACKS[requested])
+    except (FileNotFoundError, ValueError):
+        return jsonify({'error': 'Image not found'}), 404
+    response = send_file(
+        path,
+        mimetype=image_store.mimetype(image_hash, variant),
+        etag=f"{image_hash}.{variant or 'original'}",
+        conditional=True,
+        max_age=31536000
+    )
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
 @app.route('/download-pdf', methods=['POST'])
 def download_pdf():
     """Download description as PDF file"""
     try:
-        data = request.get_json()
-        description = data.get('description', '')
-        damage_type = data.get('damage_type', 'loss_description')
-        image_data = data.get('image_data', '')
+        with span('download-pdf', 'parse'):
+            data = request.get_json()
+            damage_type = data.get('damage_type', 'loss_description')
+            claim = {
+                'damage_type': damage_type,
+                'loss_description': data.get('description', ''),
+                'image_hash': data.get('image_hash', ''),
+                # Legacy clients post the image itself
+                'image_data': data.get('image_data', '')
+            }
         
-        buffer = BytesIO()
-        p = canvas.Canvas(buffer, pagesize=A4)
-        width, height = A4
-
-        # Header
-        p.setFillColorRGB(0/255, 119/255, 182/255)
-        p.rect(0, height-100, width, 100, fill=1)
-        p.setFillColorRGB(1, 1, 1)
-        p.setFont("Helvetica-Bold", 20)
-        p.drawString(50, height-60, "Insurance Loss Description Report")
-        p.setFont("Helvetica", 12)
-        p.drawString(50, height-80, "Generated by ClaimInsight AI System")
-
-        # Damage Info
-        y = height - 130
-        p.setFillColorRGB(0/255, 119/255, 182/255)
-        p.setFont("Helvetica-Bold", 14)
-        p.drawString(50, y, "Damage Assessment Details")
-        p.setFillColorRGB(0, 0, 0)
-        y -= 20
-        p.setFont("Helvetica", 12)
-        p.drawString(50, y, f"Damage Type: {damage_type}")
-        y -= 20
-        p.drawString(50, y, f"Report Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-
-        # Loss Description
-        y -= 40
-        p.setFillColorRGB(0/255, 119/255, 182/255)
-        p.setFont("Helvetica-Bold", 14)
-        p.drawString(50, y, "Professional Loss Description")
-        y -= 20
-        p.setFillColorRGB(0, 0, 0)
-
-        # ✅ Wrapped text fix
-        wrapped_lines = []
-        max_width = 90  # characters per line
-        for paragraph in description.split('\n'):
-            for wrapped_line in wrap(paragraph, width=max_width):
-                wrapped_lines.append(wrapped_line)
-
-        for line in wrapped_lines:
-            if line.strip():
-                if y < 100:
-                    p.showPage()
-                    y = height - 50
-                p.setFont("Helvetica", 10)
-                p.drawString(50, y, line.strip())
-                y -= 15
-
-        # Damage Image
-        if image_data and y > 200:
-            try:
-                y -= 30
-                p.setFillColorRGB(0/255, 119/255, 182/255)
-                p.setFont("Helvetica-Bold", 14)
-                p.drawString(50, y, "Damage Image")
-                y -= 20
-                img_data = base64.b64decode(image_data)
-                img = Image.open(BytesIO(img_data))
-
-                max_width = 300
-                max_height = 200
-                img_width, img_height = img.size
-                aspect = img_width / img_height
-                if aspect > max_width/max_height:
-                    img_width = max_width
-                    img_height = img_width / aspect
-                else:
-                    img_height = max_height
-                    img_width = img_height * aspect
-
-                p.drawImage(ImageReader(img), 50, y-img_height, width=img_width, height=img_height)
-            except Exception as e:
-                print(f"Error adding image to PDF: {str(e)}")
-
-        # Footer
-        p.setFont("Helvetica", 8)
-        p.drawString(50, 30, "Confidential - For Insurance Claim Purposes")
-        p.drawString(400, 30, f"Generated on: {datetime.now().strftime('%d %b %Y')}")
-
-        p.save()
-        buffer.seek(0)
-
-        response = make_response(buffer.getvalue())
+        with span('download-pdf', 'render'):
+            pdf = report_engine.render([claim])
+        response = make_response(pdf)
         response.mimetype = 'application/pdf'
         response.headers['Content-Disposition'] = f"attachment; filename=loss_description_{damage_type.replace(' ', '_')}.pdf"
 
         return response
         
     except Exception as e:
-        print(f"Error generating PDF: {str(e)}")
+        logger.exception("Error generating PDF")
         return jsonify({'error': f'PDF generation failed: {str(e)}'}), 500
 
+def iter_history(query, columns, max_entries):
+    """Walk history pages newest first, holding one page of rows at a time"""
+    remaining = max_entries
+    while remaining > 0:
+        page = history_store.page(columns, **dict(query, limit=min(query['limit'], remaining)))
+        for entry in page:
+            remaining -= 1
+            yield entry
+        if not page.has_more:
+            return
+        query = dict(query, before_id=page.next_cursor)
+
+@app.route('/reports/history.pdf')
+def history_report():
+    """Multi-claim PDF for a filtered history range, read from the history one page at a time"""
+    query = history_query_args()
+    query['limit'] = HISTORY_MAX_PAGE_SIZE
+    max_claims = min(request.args.get('max_claims', REPORT_MAX_CLAIMS, type=int), REPORT_MAX_CLAIMS)
+    claims = iter_history(query, REPORT_COLUMNS, max_claims)
+    
+    # send_file closes the spooled report once it has been sent
+    return send_file(report_engine.spool(claims), mimetype='application/pdf',
+                     as_attachment=True, download_name='loss_history_report.pdf')
+
 @app.errorhandler(413)
 def too_large(e):
-    return jsonify({'error': 'File too large. Maximum size is 16MB.'}), 413
+    # The limit of the request that failed: /upload/batch raises its own
+    limit = request.max_content_length
+    if limit is None:
+        return jsonify({'error': 'File too large.'}), 413
+    return jsonify({'error': f'File too large. Maximum size is {limit / (1024 * 1024):g}MB.'}), 413
 
 @app.errorhandler(500)
 def internal_error(error):
@@ -0,0 +1,268 @@
+import json
+import os
+import queue
+import threading
+import time
+import zipfile
+import zlib
+from datetime import datetime
+import config
+from caption_cache import dhash
+from image_store import hash_bytes
+from ingest import build_variants, verify_image
+from metrics import maybe_profile
+
+
+IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+SENTINEL = None
+
+
+def is_image_name(name):
+    return '.' in name and name.rsplit('.', 1)[1].lower() in IMAGE_EXTENSIONS
+
+
+class RejectedImage(ValueError):
+    """Yielded in place of the bytes of a file or archive member that was not read"""
+
+
+def iter_directory_images(directory):
+    """
+    Yield (name, bytes) for files under `directory`, in a stable order;
+    files without an image extension yield a RejectedImage instead
+    """
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for filename in sorted(files):
+            path = os.path.join(root, filename)
+            if not is_image_name(filename):
+                yield os.path.relpath(path, directory), RejectedImage('unsupported file type')
+                continue
+            with open(path, 'rb') as f:
+                yield os.path.relpath(path, directory), f.read()
+
+
+# Raised by ZipFile.open/read for one damaged, encrypted or unsupported member
+MEMBER_ERRORS = (zipfile.BadZipFile, RuntimeError, NotImplementedError, EOFError, OSError, zlib.error)
+
+
+def iter_zip_images(zip_path, max_size=None, max_ratio=None):
+    """
+    Yield (name, bytes) for the members of a ZIP archive. Members without
+    an image extension, members over
+    `max_size` bytes uncompressed or `max_ratio` times their compressed
+    size are not read, and members that fail to decompress are skipped;
+    a RejectedImage is yielded instead of their bytes.
+    """
+    max_size = config.BATCH_MAX_IMAGE_SIZE if max_size is None else max_size
+    max_ratio = config.BATCH_MAX_COMPRESSION_RATIO if max_ratio is None else max_ratio
+    with zipfile.ZipFile(zip_path) as archive:
+        for info in archive.infolist():
+            if info.is_dir():
+                continue
+            if not is_image_name(info.filename):
+                yield info.filename, RejectedImage('unsupported file type')
+                continue
+            if info.file_size > max_size:
+                yield info.filename, RejectedImage(f'{info.file_size} bytes uncompressed, limit is {max_size}')
+                continue
+            if info.file_size > max_ratio * max(info.compress_size, 1):
+                yield info.filename, RejectedImage(f'compression ratio over {max_ratio:g}')
+                continue
+            # The header sizes may lie; never decompress more than the limit
+            try:
+                with archive.open(info) as member:
+                    data = member.read(max_size + 1)
+            except MEMBER_ERRORS as e:
+                yield info.filename, RejectedImage(f'unreadable archive member: {e}')
+                continue
+            if len(data) > max_size:
+                yield info.filename, RejectedImage(f'more than {max_size} bytes uncompressed')
+                continue
+            yield info.filename, data
+
+
+def read_completed(results_path):
+    """Names already ingested successfully by an earlier run of the same results file"""
+    completed = set()
+    if not os.path.exists(results_path):
+        return completed
+    with open(results_path, 'r') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by an interrupted run
+            if record.get('status') == 'ok':
+                completed.add(record['name'])
+    return completed
+
+
+class BatchIngestor:
+    """
+    Ingest many claim photos through a bounded pipeline.
+
+    A reader thread decodes and verifies images into a queue holding at
+    most two batches; the calling thread captions each batch with one
+    generate call, writes descriptions, bulk-inserts the history rows and
+    appends one JSONL record per image to `results_path`. Rerunning with
+    the same results file skips images that already succeeded.
+    """
+
+    def __init__(self, results_path, batch_size=8):
+        self.results_path = results_path
+        self.batch_size = batch_size
+
+    def _decode(self, items, completed, decoded, errors, failures):
+        import pipeline
+
+        try:
+            for name, data in items:
+                if name in completed:
+                    continue
+                try:
+                    if isinstance(data, RejectedImage):
+                        raise data
+                    verify_image(data)
+                    image_hash = hash_bytes(data)
+                    image, variants = build_variants(data)
+                    for variant, variant_data in variants.items():
+                        pipeline.image_store.put_variant(image_hash, variant, variant_data)
+                    if config.ARCHIVE_ORIGINALS:
+                        pipeline.image_store.put(data)
+                    decoded.put((name, image_hash, image))
+                except Exception as e:
+                    errors.put({'name': name, 'status': 'error', 'error': f'Invalid image file: {str(e)}'})
+        except Exception as e:
+            failures.append(e)  # the source itself failed; run() raises it
+        finally:
+            decoded.put(SENTINEL)
+
+    def _caption_batch(self, batch):
+        import pipeline
+
+        captioner, _ = pipeline.get_models()
+        captions = [None] * len(batch)
+        misses = []
+        for index, (name, image_hash, image) in enumerate(batch):
+            perceptual_hash = dhash(image)
+            captions[index] = pipeline.caption_cache.get(image_hash, perceptual_hash, captioner.preset)
+            if captions[index] is None:
+                misses.append((index, perceptual_hash))
+
+        if misses:
+            with maybe_profile('ingest-batch'):
+                generated = captioner.generate_captions([batch[index][2] for index, _ in misses])
+            for (index, perceptual_hash), caption in zip(misses, generated):
+                captions[index] = caption
+                pipeline.caption_cache.put(batch[index][1], perceptual_hash, caption, captioner.preset)
+        return captions
+
+    def _process_batch(self, batch, damage_type):
+        import pipeline
+
+        try:
+            captions = self._caption_batch(batch)
+        except Exception as e:
+            return [{'name': name, 'status': 'error', 'error': f'Caption generation failed: {str(e)}'}
+                    for name, _, _ in batch]
+
+        _, desc_generator = pipeline.get_models()
+        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        entries = []
+        records = []
+        assessments = desc_generator.assess_many(captions, damage_type)
+        for (name, image_hash, _), caption, (description, severity) in zip(batch, captions, assessments):
+            entries.append({
+                'date': timestamp,
+                'damage_type': damage_type,
+                'image_caption': caption,
+                'loss_description': description,
+                'image_hash': image_hash,
+                'severity': severity
+            })
+            records.append({
+                'name': name,
+                'status': 'ok',
+                'image_hash': image_hash,
+                'image_caption': caption,
+                'loss_description': description
+            })
+        pipeline.history_store.add_many(entries)
+        return records
+
+    def run(self, items, damage_type, on_progress=None):
+        """Ingest (name, bytes) pairs from `items` and return a run summary"""
+        completed = read_completed(self.results_path)
+        decoded = queue.Queue(maxsize=self.batch_size * 2)
+        errors = queue.Queue()
+        failures = []
+        reader = threading.Thread(
+            target=self._decode,
+            args=(items, completed, decoded, errors, failures),
+            name='batch-decode',
+            daemon=True
+        )
+
+        counts = {'ok': 0, 'error': 0}
+        started = time.monotonic()
+        reader.start()
+        with open(self.results_path, 'a') as results:
+            def write(records):
+                for record in records:
+                    results.write(json.dumps(record) + '\n')
+                    counts[record['status']] += 1
+                results.flush()
+                if on_progress is not None:
+                    on_progress(counts)
+
+            done = False
+            while not done:
+                batch = []
+                while len(batch) < self.batch_size:
+                    item = decoded.get()
+                    if item is SENTINEL:
+                        done = True
+                        break
+                    batch.append(item)
+
+                failures = []
+                while not errors.empty():
+                    failures.append(errors.get())
+                write(failures + (self._process_batch(batch, damage_type) if batch else []))
+
+        reader.join()
+        if failures:
+            raise failures[0]
+        elapsed = time.monotonic() - started
+        return {
+            'processed': counts['ok'],
+            'errors': counts['error'],
+            'skipped': len(completed),
+            'seconds': round(elapsed, 3),
+            'images_per_second': round(counts['ok'] / elapsed, 3) if elapsed > 0 else 0.0,
+            'results_path': self.results_path
+        }
+
+
+def run_batch(source, results_path, damage_type, batch_size=8, on_progress=None):
+    """Ingest a directory or ZIP archive and write <results>.summary.json next to the results"""
+    items = iter_zip_images(source) if zipfile.is_zipfile(source) else iter_directory_images(source)
+    summary = BatchIngestor(results_path, batch_size).run(items, damage_type, on_progress)
+    with open(results_path + '.summary.json', 'w') as f:
+        json.dump(summary, f)
+    return summary
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Bulk-ingest claim photos from a directory or ZIP archive')
+    parser.add_argument('source', help='directory of images or a .zip archive')
+    parser.add_argument('--damage-type', default='Unknown Damage')
+    parser.add_argument('--results', default='batch_results.jsonl', help='JSONL results file; rerun with the same file to resume')
+    parser.add_argument('--batch-size', type=int, default=8)
+    args = parser.parse_args()
+
+    summary = run_batch(args.source, args.results, args.damage_type, args.batch_size)
+    print(f"✅ Ingested {summary['processed']} images ({summary['errors']} errors, {summary['skipped']} skipped) "
+          f"at {summary['images_per_second']} images/s")
@@ -0,0 +1,86 @@
+"""
+Latency/quality benchmark for the ImageCaptioner decoding presets.
+
+Captions every sample image with each preset and reports p50/p95 latency
+plus agreement with the 'quality' preset (exact match rate and mean token
+Jaccard similarity):
+
+    python benchmarks/decoding_presets.py --images uploads --repeat 3 --threads 4
+"""
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from PIL import Image  # noqa: E402
+from image_captioner import ImageCaptioner, DECODING_PRESETS  # noqa: E402
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def jaccard(a, b):
+    a, b = set(a.lower().split()), set(b.lower().split())
+    return len(a & b) / len(a | b) if a | b else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', default=os.path.join(ROOT, 'uploads'), help='directory of sample images')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per image and preset')
+    parser.add_argument('--threads', type=int, help='torch intra-op threads')
+    parser.add_argument('--quantize', action='store_true')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    paths = sorted(p for ext in ('jpg', 'jpeg', 'png') for p in glob.glob(os.path.join(args.images, f'*.{ext}')))
+    if not paths:
+        parser.error(f"No images found in {args.images}")
+    images = [Image.open(path).convert('RGB') for path in paths]
+
+    captioner = ImageCaptioner(quantize=args.quantize, num_threads=args.threads)
+    captioner.warm_up()
+
+    captions = {}
+    latencies = {}
+    for preset in DECODING_PRESETS:
+        captions[preset] = []
+        latencies[preset] = []
+        for image in images:
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                caption = captioner.generate_captions([image], preset)[0]
+                latencies[preset].append(time.perf_counter() - started)
+            captions[preset].append(caption)
+
+    results = []
+    reference = captions['quality']
+    for preset in DECODING_PRESETS:
+        result = {
+            'preset': preset,
+            'p50_ms': round(percentile(latencies[preset], 0.50) * 1000, 1),
+            'p95_ms': round(percentile(latencies[preset], 0.95) * 1000, 1),
+            'exact_agreement': round(sum(a == b for a, b in zip(captions[preset], reference)) / len(reference), 3),
+            'token_jaccard': round(statistics.mean(jaccard(a, b) for a, b in zip(captions[preset], reference)), 3),
+            'captions': dict(zip((os.path.basename(p) for p in paths), captions[preset])),
+        }
+        results.append(result)
+        print(f"{preset:10s} p50 {result['p50_ms']:8.1f} ms  p95 {result['p95_ms']:8.1f} ms  "
+              f"exact {result['exact_agreement']:.2f}  jaccard {result['token_jaccard']:.2f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,350 @@
+"""
+Load test for the Flask endpoints under gunicorn.
+
+Starts the app with gunicorn.conf.py in a scratch data directory, seeds
+the history with a few uploads, then replays a weighted mix of /upload,
+/history and /download-pdf requests from concurrent clients. Uploads use
+the sample images re-encoded at several sizes. Reports throughput and
+p50/p95/p99 latency per endpoint:
+
+    python benchmarks/gunicorn_load.py --captioner stub --duration 30 --concurrency 16
+    python benchmarks/gunicorn_load.py --mix upload=1 --wait-jobs --output upload.json
+    python benchmarks/gunicorn_load.py --url http://localhost:5000   # an already running app
+
+Use --captioner stub (optionally with --stub-delay-ms) to measure the web
+tier alone. With --baseline, p95 latency and throughput are compared with
+an earlier --output file.
+"""
+import argparse
+import glob
+import io
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MIX = 'upload=2,history=5,pdf=3'
+DEFAULT_SIZES = (640, 1280, 2560)
+SEED_UPLOADS = 4
+DAMAGE_TYPES = ('Water Damage', 'Fire Damage', 'Hail Damage', 'Storm Damage')
+DESCRIPTION = (
+    "**MODERATE DAMAGE ASSESSMENT**: The inspection reveals notable damage that, while not catastrophic, "
+    "demands professional repair and restoration. " * 4
+)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name not in ('upload', 'history', 'pdf'):
+            raise ValueError(f"Unknown endpoint '{name}' in --mix; use upload, history or pdf")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def build_payloads(image_dir, sizes):
+    """JPEG bytes of every sample image at every long-edge size"""
+    paths = sorted(p for ext in ('jpg', 'jpeg', 'png') for p in glob.glob(os.path.join(image_dir, f'*.{ext}')))
+    paths = paths or [os.path.join(ROOT, 'test_image.jpg')]
+    payloads = []
+    for path in paths:
+        with Image.open(path) as source:
+            source = source.convert('RGB')
+            for size in sizes:
+                image = source.copy()
+                scale = size / max(image.size)
+                image = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))))
+                buffer = io.BytesIO()
+                image.save(buffer, 'JPEG', quality=90)
+                payloads.append((f"{os.path.splitext(os.path.basename(path))[0]}_{size}.jpg", size, buffer.getvalue()))
+    return payloads
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args, workdir):
+    """Run gunicorn in `workdir` so every data/ path points at scratch state"""
+    port = free_port()
+    env = dict(
+        os.environ,
+        BIND=f'127.0.0.1:{port}',
+        WEB_CONCURRENCY=str(args.web_workers),
+        WEB_THREADS=str(args.web_threads),
+        UPLOAD_WORKERS=str(args.upload_workers),
+        CAPTIONER=args.captioner,
+        STUB_CAPTION_DELAY_MS=str(args.stub_delay_ms),
+        PYTHONPATH=ROOT + os.pathsep + os.environ.get('PYTHONPATH', '')
+    )
+    log = open(os.path.join(workdir, 'gunicorn.log'), 'w')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', os.path.join(ROOT, 'gunicorn.conf.py'), 'app:app'],
+        cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    return process, f'http://127.0.0.1:{port}'
+
+
+def wait_ready(url, timeout, process=None):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with status {process.returncode}")
+        try:
+            if requests.get(f'{url}/ready', timeout=2).status_code == 200:
+                return
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"{url} not ready after {timeout}s")
+
+
+def wait_for_job(session, url, status_url, timeout=600):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = session.get(url + status_url, timeout=30).json()
+        if job['status'] in ('done', 'failed'):
+            return job
+        time.sleep(0.05)
+    raise TimeoutError(status_url)
+
+
+class LoadTest:
+    """Closed-loop clients: each one sends its next request when the previous one returns"""
+
+    def __init__(self, url, payloads, mix, wait_jobs, seed):
+        self.url = url
+        self.payloads = payloads
+        self.mix = mix
+        self.wait_jobs = wait_jobs
+        self.seed = seed
+        self.image_hashes = []
+        self.samples = []  # (endpoint, label, seconds, ok)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def session(self):
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def upload(self, rng):
+        name, size, data = rng.choice(self.payloads)
+        response = self.session().post(
+            f'{self.url}/upload',
+            files={'file': (name, data, 'image/jpeg')},
+            data={'damage_type': rng.choice(DAMAGE_TYPES)},
+            timeout=120
+        )
+        ok = response.status_code == 202
+        if ok and self.wait_jobs:
+            job = wait_for_job(self.session(), self.url, response.json()['status_url'])
+            ok = job['status'] == 'done'
+            if ok:
+                with self._lock:
+                    self.image_hashes.append(job['result']['image_hash'])
+        return f'upload_{size}', ok
+
+    def history(self, rng):
+        response = self.session().get(f'{self.url}/history', params={'limit': rng.choice((20, 50, 200))}, timeout=120)
+        return 'history', response.status_code == 200
+
+    def pdf(self, rng):
+        with self._lock:
+            image_hash = rng.choice(self.image_hashes) if self.image_hashes else ''
+        response = self.session().post(
+            f'{self.url}/download-pdf',
+            json={'damage_type': rng.choice(DAMAGE_TYPES), 'description': DESCRIPTION, 'image_hash': image_hash},
+            timeout=120
+        )
+        return 'pdf', response.status_code == 200 and response.content.startswith(b'%PDF')
+
+    def seed_history(self):
+        session = requests.Session()
+        for name, _, data in self.payloads[:SEED_UPLOADS]:
+            response = session.post(f'{self.url}/upload', files={'file': (name, data, 'image/jpeg')},
+                                    data={'damage_type': DAMAGE_TYPES[0]}, timeout=120)
+            response.raise_for_status()
+            job = wait_for_job(session, self.url, response.json()['status_url'])
+            if job['status'] == 'done':
+                self.image_hashes.append(job['result']['image_hash'])
+
+    def client(self, index, deadline, max_requests):
+        rng = random.Random(self.seed + index)
+        endpoints = list(self.mix)
+        weights = [self.mix[name] for name in endpoints]
+        sent = 0
+        while time.monotonic() < deadline and (max_requests is None or sent < max_requests):
+            endpoint = rng.choices(endpoints, weights)[0]
+            started = time.perf_counter()
+            try:
+                label, ok = getattr(self, endpoint)(rng)
+            except Exception:
+                label, ok = endpoint, False
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.samples.append((endpoint, label, elapsed, ok))
+            sent += 1
+
+    def run(self, concurrency, duration, requests_per_client):
+        deadline = time.monotonic() + duration
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for future in [executor.submit(self.client, index, deadline, requests_per_client)
+                           for index in range(concurrency)]:
+                future.result()
+        return time.perf_counter() - started
+
+
+def summarize(samples, elapsed, key):
+    groups = {}
+    for sample in samples:
+        groups.setdefault(sample[key], []).append(sample)
+    groups['all'] = samples
+
+    summary = {}
+    for name, group in sorted(groups.items()):
+        latencies = [seconds for _, _, seconds, ok in group if ok]
+        summary[name] = {
+            'requests': len(group),
+            'errors': sum(1 for *_, ok in group if not ok),
+            'throughput_rps': round(len(group) / elapsed, 2),
+        }
+        if latencies:
+            summary[name].update({
+                'mean_ms': round(1000 * sum(latencies) / len(latencies), 1),
+                'p50_ms': round(1000 * percentile(latencies, 0.50), 1),
+                'p95_ms': round(1000 * percentile(latencies, 0.95), 1),
+                'p99_ms': round(1000 * percentile(latencies, 0.99), 1),
+            })
+    return summary
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, 'r') as f:
+        baseline = json.load(f)
+    print(f"\nAgainst {baseline_path} (commit {baseline.get('commit')}):")
+    for name, current in results['endpoints'].items():
+        before = baseline.get('endpoints', {}).get(name)
+        if not before or 'p95_ms' not in before or 'p95_ms' not in current or not before['throughput_rps']:
+            continue
+        p95_change = 100 * (current['p95_ms'] - before['p95_ms']) / before['p95_ms']
+        rps_change = 100 * (current['throughput_rps'] - before['throughput_rps']) / before['throughput_rps']
+        print(f"{name:>14}  p95 {before['p95_ms']:>8.1f} -> {current['p95_ms']:>8.1f} ms ({p95_change:+.0f}%)"
+              f"  throughput {rps_change:+.0f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='test an already running app instead of starting gunicorn')
+    parser.add_argument('--images', default=os.path.join(ROOT, 'uploads'), help='directory of sample images')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES), help='long-edge sizes of uploads')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='endpoint weights, e.g. upload=2,history=5,pdf=3')
+    parser.add_argument('--concurrency', type=int, default=8, help='concurrent clients')
+    parser.add_argument('--duration', type=float, default=30, help='seconds to run')
+    parser.add_argument('--requests', type=int, help='stop each client after this many requests')
+    parser.add_argument('--wait-jobs', action='store_true', help='time uploads until their job finishes, not until 202')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--captioner', choices=('blip', 'stub'), default='stub')
+    parser.add_argument('--stub-delay-ms', type=float, default=0, help='simulated inference time per image')
+    parser.add_argument('--web-workers', type=int, default=2)
+    parser.add_argument('--web-threads', type=int, default=8)
+    parser.add_argument('--upload-workers', type=int, default=2)
+    parser.add_argument('--ready-timeout', type=float, default=600)
+    parser.add_argument('--keep-data', action='store_true', help='keep the scratch data directory')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--baseline', help='earlier --output file to compare against')
+    args = parser.parse_args()
+
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+    payloads = build_payloads(args.images, args.sizes)
+
+    process = None
+    workdir = tempfile.mkdtemp(prefix='claiminsight-load-')
+    try:
+        if args.url:
+            url = args.url.rstrip('/')
+            wait_ready(url, args.ready_timeout)
+        else:
+            process, url = start_server(args, workdir)
+            wait_ready(url, args.ready_timeout, process)
+
+        test = LoadTest(url, payloads, mix, args.wait_jobs, args.seed)
+        test.seed_history()
+        elapsed = test.run(args.concurrency, args.duration, args.requests)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+        if args.keep_data:
+            print(f"Scratch data kept in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'config': {
+            'mix': mix,
+            'sizes': args.sizes,
+            'images': len(payloads) // len(args.sizes),
+            'concurrency': args.concurrency,
+            'duration': args.duration,
+            'wait_jobs': args.wait_jobs,
+            'captioner': None if args.url else args.captioner,
+            'stub_delay_ms': None if args.url else args.stub_delay_ms,
+            'web_workers': None if args.url else args.web_workers,
+            'web_threads': None if args.url else args.web_threads,
+            'upload_workers': None if args.url else args.upload_workers,
+            'seed': args.seed,
+        },
+        'seconds': round(elapsed, 3),
+        'endpoints': summarize(test.samples, elapsed, 0),
+        'labels': summarize(test.samples, elapsed, 1),
+    }
+
+    for name, row in results['endpoints'].items():
+        latency = f"p50 {row['p50_ms']:>8.1f}  p95 {row['p95_ms']:>8.1f}  p99 {row['p99_ms']:>8.1f} ms" if 'p50_ms' in row else 'no successful requests'
+        print(f"{name:>14}  {row['requests']:>6} req  {row['errors']:>4} err  {row['throughput_rps']:>7.1f} req/s  {latency}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Latency of SQLiteHistoryStore.search on a synthetic history.
+
+Fills a temporary database with generated entries (descriptions from
+DescriptionGenerator) and times text, filtered and facet-only queries;
+text match counts over SEARCH_FACET_LIMIT are lower bounds, shown with +:
+
+    python benchmarks/history_search.py --entries 1000000 --repeat 20
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from description_generator import DescriptionGenerator  # noqa: E402
+from history_store import SQLiteHistoryStore  # noqa: E402
+
+CAPTIONS = (
+    'a car with a broken window and a dented door',
+    'a roof with minor scratches on the shingles',
+    'water stains on the ceiling of a living room',
+    'a flooded basement with several boxes',
+    'a tree fallen on a parked car',
+    'a kitchen with smoke damage on the walls',
+    'a fence with graffiti on it',
+    'a cracked windshield with small chips',
+)
+DAMAGE_TYPES = ('Collision Damage', 'Hail Damage', 'Water Damage', 'Flood Damage', 'Storm Damage', 'Fire Damage', 'Vandalism')
+
+QUERIES = {
+    'text': {'text': 'broken window'},
+    'text_no_facets': {'text': 'broken window', 'facets': False},
+    'text_prefix_filtered': {'text': 'flood*', 'severity': 'moderate', 'date_from': '2025-03-01'},
+    'browse_filtered': {'damage_type': 'Water Damage', 'date_from': '2025-06-01', 'date_to': '2025-06-30 23:59:59'},
+    'browse_all': {},
+}
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def populate(store, entries, seed):
+    rng = random.Random(seed)
+    generator = DescriptionGenerator()
+    descriptions = {}
+    batch = []
+    for _ in range(entries):
+        caption, damage_type = rng.choice(CAPTIONS), rng.choice(DAMAGE_TYPES)
+        if (caption, damage_type) not in descriptions:
+            descriptions[caption, damage_type] = generator.assess(caption, damage_type)
+        description, severity = descriptions[caption, damage_type]
+        batch.append({
+            'date': f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:00:00",
+            'damage_type': damage_type,
+            'image_caption': caption,
+            'loss_description': description,
+            'severity': severity
+        })
+        if len(batch) == 10000:
+            store.add_many(batch)
+            batch = []
+    store.add_many(batch)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--entries', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    store = SQLiteHistoryStore(os.path.join(tempfile.mkdtemp(), 'history.db'))
+    started = time.perf_counter()
+    populate(store, args.entries, args.seed)
+    print(f"Inserted {args.entries} entries in {time.perf_counter() - started:.1f}s")
+
+    results = []
+    for name, query in QUERIES.items():
+        latencies = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            result = store.search(limit=50, **query)
+            latencies.append(time.perf_counter() - started)
+        results.append({
+            'query': name,
+            'matches': result['total'],
+            'facets_capped': result['facets_capped'],
+            'p50_ms': round(1000 * statistics.median(latencies), 2),
+            'p95_ms': round(1000 * percentile(latencies, 0.95), 2),
+        })
+        matches = '-' if result['total'] is None else f"{result['total']}{'+' if result['facets_capped'] else ''}"
+        print(f"{name:>22}  {matches:>8} matches  p50 {results[-1]['p50_ms']:>8.2f} ms  p95 {results[-1]['p95_ms']:>8.2f} ms")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'entries': args.entries, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Cold-start benchmark for ImageCaptioner loading modes.
+
+Each mode runs in a fresh interpreter so load time, first-caption latency
+and peak RSS are not skewed by an earlier mode:
+
+    python benchmarks/model_load.py --image test_image.jpg
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = {
+    'baseline': {},
+    'quantized': {'quantize': True},
+    'quantized+torchscript': {'quantize': True, 'torchscript': True},
+}
+
+
+def measure(mode, image_path):
+    sys.path.insert(0, ROOT)
+    from PIL import Image
+    from image_captioner import ImageCaptioner
+
+    started = time.perf_counter()
+    captioner = ImageCaptioner(**MODES[mode])
+    load_seconds = time.perf_counter() - started
+
+    image = Image.open(image_path).convert('RGB')
+    started = time.perf_counter()
+    caption = captioner.generate_captions([image])[0]
+    first_caption_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    captioner.generate_captions([image])
+    warm_caption_seconds = time.perf_counter() - started
+
+    return {
+        'mode': mode,
+        'load_seconds': round(load_seconds, 3),
+        'first_caption_seconds': round(first_caption_seconds, 3),
+        'warm_caption_seconds': round(warm_caption_seconds, 3),
+        # ru_maxrss is in KiB on Linux
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'caption': caption,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--image', default=os.path.join(ROOT, 'test_image.jpg'))
+    parser.add_argument('--modes', nargs='+', default=list(MODES), choices=list(MODES))
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.child, args.image)))
+        return
+
+    results = []
+    for mode in args.modes:
+        output = subprocess.run(
+            [sys.executable, __file__, '--child', mode, '--image', args.image],
+            check=True, capture_output=True, text=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        results.append(result)
+        print(f"{mode:24s} load {result['load_seconds']:7.2f}s  first {result['first_caption_seconds']:6.2f}s  "
+              f"warm {result['warm_caption_seconds']:6.2f}s  rss {result['peak_rss_mb']:8.1f} MB  '{result['caption']}'")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
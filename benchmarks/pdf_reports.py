@@ -0,0 +1,105 @@
+"""
+CPU time and peak memory of ReportEngine for reports of growing size.
+
+Every claim gets its own photo, cropped from the sample images and
+ingested into a temporary image store like an upload, so the numbers
+include reading and embedding one image per claim:
+
+    python benchmarks/pdf_reports.py --claims 1 10 100 1000
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from io import BytesIO
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from PIL import Image  # noqa: E402
+
+from image_store import ImageStore  # noqa: E402
+from ingest import ingest_image  # noqa: E402
+from pdf_generator import ReportEngine  # noqa: E402
+
+DESCRIPTION = (
+    "**MODERATE DAMAGE ASSESSMENT**: The inspection reveals notable damage that, while not catastrophic, "
+    "demands professional repair and restoration. " * 4
+)
+
+
+def distinct_images(image_store, paths, count):
+    """
+    Store `count` different photos with their ingest variants, derived
+    from the samples by cropping, so neither reportlab's duplicate image
+    detection nor the engine's image cache hides per-image cost
+    """
+    samples = [Image.open(path).convert('RGB') for path in paths]
+    hashes = []
+    for index in range(count):
+        sample = samples[index % len(samples)]
+        width, height = sample.size
+        left, top = divmod(index // len(samples), max(1, min(width, height) // 4))
+        buffer = BytesIO()
+        sample.crop((left, top, width - top, height - left)).save(buffer, 'JPEG', quality=90)
+        hashes.append(ingest_image(image_store, buffer.getvalue())[0])
+    return hashes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', default=os.path.join(ROOT, 'uploads'), help='directory of sample images')
+    parser.add_argument('--claims', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.images, '*.jpg'))) or [os.path.join(ROOT, 'test_image.jpg')]
+    image_store = ImageStore(tempfile.mkdtemp())
+    hashes = distinct_images(image_store, paths, max(args.claims))
+
+    results = []
+    for count in args.claims:
+        claims = (
+            {
+                'date': '2025-01-01 12:00:00',
+                'damage_type': 'Storm Damage',
+                'loss_description': DESCRIPTION,
+                'image_hash': hashes[index % len(hashes)],
+            }
+            for index in range(count)
+        )
+        engine = ReportEngine(image_store)
+
+        tracemalloc.start()
+        cpu_started = time.process_time()
+        wall_started = time.perf_counter()
+        with engine.spool(claims) as output:
+            size = output.seek(0, os.SEEK_END)
+        cpu_seconds = time.process_time() - cpu_started
+        wall_seconds = time.perf_counter() - wall_started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        result = {
+            'claims': count,
+            'cpu_seconds': round(cpu_seconds, 4),
+            'wall_seconds': round(wall_seconds, 4),
+            'cpu_ms_per_claim': round(cpu_seconds * 1000 / count, 2),
+            'peak_python_memory_mb': round(peak / 1024 / 1024, 2),
+            'pdf_kb': round(size / 1024, 1),
+        }
+        results.append(result)
+        print(f"{count:6d} claims  cpu {result['cpu_seconds']:8.3f}s  ({result['cpu_ms_per_claim']:6.2f} ms/claim)  "
+              f"peak {result['peak_python_memory_mb']:7.2f} MB  pdf {result['pdf_kb']:9.1f} KB")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
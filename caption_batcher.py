@@ -0,0 +1,100 @@
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+from metrics import maybe_profile
+
+
+class CaptionBatcher:
+    """
+    Dynamic micro-batching in front of ImageCaptioner.
+
+    Request threads submit images and wait on a future; a single scheduler
+    thread collects whatever is pending, up to `max_batch_size` images or
+    `max_wait_ms` after the first one arrived, and runs them through one
+    batched `generate_captions` call. Batching only happens when requests
+    overlap, so run gunicorn with threaded workers (e.g. --threads 8).
+    """
+
+    def __init__(self, captioner, max_batch_size=8, max_wait_ms=20):
+        self.captioner = captioner
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._images = 0
+        self._batch_sizes = Counter()
+        self._thread = threading.Thread(target=self._run, name='caption-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, image, preset=None):
+        """Queue an RGB PIL image and return a Future resolving to its caption"""
+        future = Future()
+        self._queue.put((image, preset, future))
+        return future
+
+    def caption(self, image, preset=None, timeout=None):
+        return self.submit(image, preset).result(timeout=timeout)
+
+    def is_alive(self):
+        return self._thread.is_alive()
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queue_depth': self.queue_depth(),
+                'batches': self._batches,
+                'images': self._images,
+                'mean_batch_size': self._images / self._batches if self._batches else 0.0,
+                'batch_sizes': dict(sorted(self._batch_sizes.items())),
+            }
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # Drop callers that gave up before their turn
+            batch = [item for item in batch if item[2].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            # One generate call per decoding preset present in the batch
+            groups = {}
+            for image, preset, future in batch:
+                groups.setdefault(preset, []).append((image, future))
+
+            for preset, group in groups.items():
+                try:
+                    # Sampled profiles cover the model itself, in job workers and model servers alike
+                    with maybe_profile('caption-batch'):
+                        captions = self.captioner.generate_captions([image for image, _ in group], preset)
+                except Exception as e:
+                    for _, future in group:
+                        future.set_exception(e)
+                else:
+                    for (_, future), caption in zip(group, captions):
+                        future.set_result(caption)
+
+                # Stats count generate calls, so a collection split by preset is several batches
+                with self._lock:
+                    self._batches += 1
+                    self._images += len(group)
+                    self._batch_sizes[len(group)] += 1
@@ -0,0 +1,263 @@
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+from presets import PRESET_RANK
+
+
+# Both tiers split the 64-bit dHash into hamming_threshold + 1 bands and
+# index each one; by pigeonhole, a hash within the threshold of a stored
+# hash agrees with it on at least one band.
+HASH_BITS = 64
+
+
+def dhash(image, hash_size=8):
+    """64-bit difference hash; survives resizing and JPEG recompression"""
+    gray = image.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = list(gray.getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+def bands(perceptual_hash, count):
+    """Split a hash into `count` bands of equal width; the last takes any remaining bits"""
+    width = HASH_BITS // count
+    values = [(perceptual_hash >> (i * width)) & ((1 << width) - 1) for i in range(count - 1)]
+    values.append(perceptual_hash >> ((count - 1) * width))
+    return values
+
+
+def _signed(value):
+    """SQLite integers are signed 64-bit; a single band is the whole hash"""
+    return value - (1 << HASH_BITS) if value >> (HASH_BITS - 1) else value
+
+
+class CaptionCache:
+    """
+    Two-level caption cache.
+
+    Lookups try the SHA-256 of the uploaded bytes first, then the nearest
+    perceptual hash within `hamming_threshold` bits. Entries live in a
+    bounded in-memory LRU and, when `disk_path` is given, in a SQLite tier
+    that survives restarts. Each caption keeps the decoding preset that
+    produced it and only answers lookups for that preset or a cheaper one;
+    entries from before presets were recorded never match. Larger
+    thresholds mean more, narrower bands and more candidates per lookup.
+    """
+
+    def __init__(self, max_entries=4096, hamming_threshold=3, disk_path=None):
+        if not 0 <= hamming_threshold < HASH_BITS:
+            raise ValueError(f"hamming_threshold must be between 0 and {HASH_BITS - 1}")
+        self.max_entries = max_entries
+        self.hamming_threshold = hamming_threshold
+        self.band_count = hamming_threshold + 1
+        self.disk_path = disk_path
+        self._entries = OrderedDict()  # exact hash -> (perceptual hash, caption, preset)
+        self._buckets = [{} for _ in range(self.band_count)]  # per band: band value -> exact hashes
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._counters = {'exact_hits': 0, 'perceptual_hits': 0, 'disk_hits': 0, 'misses': 0}
+        if disk_path:
+            directory = os.path.dirname(disk_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._init_disk()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.disk_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _init_disk(self):
+        """
+        Create the tables, or migrate them: caption_bands is rebuilt from
+        the stored hashes when it was built for another band count (kept
+        in user_version), and caches from before the band index moved out
+        of captions lose their band0..band3 columns.
+        """
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS captions (
+                    exact_hash TEXT PRIMARY KEY,
+                    perceptual_hash TEXT NOT NULL,
+                    caption TEXT NOT NULL,
+                    preset TEXT
+                )
+            """)
+            existing = {row[1] for row in conn.execute('PRAGMA table_info(captions)')}
+            if 'preset' not in existing:
+                conn.execute('ALTER TABLE captions ADD COLUMN preset TEXT')
+            if 'band0' in existing:
+                conn.execute('ALTER TABLE captions RENAME TO captions_banded')
+                conn.execute("""
+                    CREATE TABLE captions (
+                        exact_hash TEXT PRIMARY KEY,
+                        perceptual_hash TEXT NOT NULL,
+                        caption TEXT NOT NULL,
+                        preset TEXT
+                    )
+                """)
+                conn.execute("""
+                    INSERT INTO captions (exact_hash, perceptual_hash, caption, preset)
+                    SELECT exact_hash, perceptual_hash, caption, preset FROM captions_banded
+                """)
+                conn.execute('DROP TABLE captions_banded')
+
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS caption_bands (
+                    band INTEGER NOT NULL,
+                    value INTEGER NOT NULL,
+                    exact_hash TEXT NOT NULL,
+                    PRIMARY KEY (band, value, exact_hash)
+                ) WITHOUT ROWID
+            """)
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_caption_bands_exact ON caption_bands(exact_hash)')
+            if conn.execute('PRAGMA user_version').fetchone()[0] != self.band_count:
+                conn.execute('DELETE FROM caption_bands')
+                for exact_hash, perceptual_hash in conn.execute(
+                    'SELECT exact_hash, perceptual_hash FROM captions'
+                ).fetchall():
+                    self._insert_bands(conn, exact_hash, int(perceptual_hash, 16))
+                conn.execute(f'PRAGMA user_version = {self.band_count}')
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _insert_bands(self, conn, exact_hash, perceptual_hash):
+        conn.executemany(
+            'INSERT OR IGNORE INTO caption_bands (band, value, exact_hash) VALUES (?, ?, ?)',
+            [(band, _signed(value), exact_hash) for band, value in enumerate(bands(perceptual_hash, self.band_count))]
+        )
+
+    def _index(self, exact_hash, perceptual_hash):
+        for bucket, value in zip(self._buckets, bands(perceptual_hash, self.band_count)):
+            bucket.setdefault(value, set()).add(exact_hash)
+
+    def _unindex(self, exact_hash, perceptual_hash):
+        for bucket, value in zip(self._buckets, bands(perceptual_hash, self.band_count)):
+            keys = bucket.get(value)
+            if keys is not None:
+                keys.discard(exact_hash)
+                if not keys:
+                    del bucket[value]
+
+    def _remember(self, exact_hash, perceptual_hash, caption, preset):
+        with self._lock:
+            previous = self._entries.get(exact_hash)
+            if previous is not None:
+                self._unindex(exact_hash, previous[0])
+            self._entries[exact_hash] = (perceptual_hash, caption, preset)
+            self._entries.move_to_end(exact_hash)
+            self._index(exact_hash, perceptual_hash)
+            while len(self._entries) > self.max_entries:
+                evicted, (evicted_hash, _, _) = self._entries.popitem(last=False)
+                self._unindex(evicted, evicted_hash)
+
+    @staticmethod
+    def _serves(stored_preset, rank):
+        return PRESET_RANK.get(stored_preset, -1) >= rank
+
+    def _count(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def _lookup_memory(self, exact_hash, perceptual_hash, rank):
+        with self._lock:
+            entry = self._entries.get(exact_hash)
+            if entry is not None and self._serves(entry[2], rank):
+                self._entries.move_to_end(exact_hash)
+                return entry[1], entry[2], 'exact_hits'
+
+            candidates = set()
+            for bucket, value in zip(self._buckets, bands(perceptual_hash, self.band_count)):
+                candidates.update(bucket.get(value, ()))
+            best = None
+            for key in candidates:
+                stored_hash, caption, stored_preset = self._entries[key]
+                if not self._serves(stored_preset, rank):
+                    continue
+                distance = hamming(perceptual_hash, stored_hash)
+                if distance <= self.hamming_threshold and (best is None or distance < best[0]):
+                    best = (distance, key, caption, stored_preset)
+            if best is not None:
+                self._entries.move_to_end(best[1])
+                return best[2], best[3], 'perceptual_hits'
+        return None, None, None
+
+    def _lookup_disk(self, exact_hash, perceptual_hash, rank):
+        conn = self._connect()
+        row = conn.execute('SELECT caption, preset FROM captions WHERE exact_hash = ?', (exact_hash,)).fetchone()
+        if row is not None and self._serves(row[1], rank):
+            return row
+
+        conditions = ' OR '.join(['(band = ? AND value = ?)'] * self.band_count)
+        params = [param for band, value in enumerate(bands(perceptual_hash, self.band_count))
+                  for param in (band, _signed(value))]
+        best = None
+        for stored_hash, caption, stored_preset in conn.execute(
+            f'SELECT perceptual_hash, caption, preset FROM captions WHERE exact_hash IN '
+            f'(SELECT exact_hash FROM caption_bands WHERE {conditions})', params
+        ):
+            if not self._serves(stored_preset, rank):
+                continue
+            distance = hamming(perceptual_hash, int(stored_hash, 16))
+            if distance <= self.hamming_threshold and (best is None or distance < best[0]):
+                best = (distance, caption, stored_preset)
+        return best[1:] if best else (None, None)
+
+    def get(self, exact_hash, perceptual_hash, preset):
+        """Return a cached caption at least as good as `preset` for an image, or None on a miss"""
+        rank = PRESET_RANK[preset]
+        caption, stored_preset, counter = self._lookup_memory(exact_hash, perceptual_hash, rank)
+        if caption is None and self.disk_path:
+            caption, stored_preset = self._lookup_disk(exact_hash, perceptual_hash, rank)
+            if caption is not None:
+                counter = 'disk_hits'
+                self._remember(exact_hash, perceptual_hash, caption, stored_preset)
+        self._count(counter or 'misses')
+        return caption
+
+    def put(self, exact_hash, perceptual_hash, caption, preset):
+        """Store a caption generated with `preset`"""
+        self._remember(exact_hash, perceptual_hash, caption, preset)
+        if self.disk_path:
+            conn = self._connect()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.execute(
+                    'INSERT OR REPLACE INTO captions (exact_hash, perceptual_hash, caption, preset) VALUES (?, ?, ?, ?)',
+                    (exact_hash, format(perceptual_hash, '016x'), caption, preset)
+                )
+                conn.execute('DELETE FROM caption_bands WHERE exact_hash = ?', (exact_hash,))
+                self._insert_bands(conn, exact_hash, perceptual_hash)
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['entries'] = len(self._entries)
+        lookups = sum(stats[name] for name in ('exact_hits', 'perceptual_hits', 'disk_hits', 'misses'))
+        stats['hit_rate'] = (lookups - stats['misses']) / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,83 @@
+import os
+
+# Settings shared by the web app and the background workers.
+# Every value can be overridden through the environment.
+
+# Legacy whole-file history, imported into the history store on first start
+HISTORY_FILE = 'data/detection_history.json'
+HISTORY_BACKEND = os.environ.get('HISTORY_BACKEND', 'sqlite')
+HISTORY_DB = os.environ.get('HISTORY_DB', 'data/history.db')
+
+IMAGE_STORE_DIR = os.environ.get('IMAGE_STORE_DIR', 'data/images')
+# Keep uploaded originals next to their derived variants (also per upload
+# with the archive_original form field); off, only the variants are stored
+ARCHIVE_ORIGINALS = os.environ.get('ARCHIVE_ORIGINALS', '0') == '1'
+
+# Caption micro-batching
+CAPTION_BATCH_SIZE = int(os.environ.get('CAPTION_BATCH_SIZE', 8))
+CAPTION_BATCH_WAIT_MS = float(os.environ.get('CAPTION_BATCH_WAIT_MS', 20))
+
+# Caption cache (exact + perceptual hash)
+CAPTION_CACHE_SIZE = int(os.environ.get('CAPTION_CACHE_SIZE', 4096))
+# Perceptual matches within this many bits (0-63); the hash index uses one band per bit plus one
+CAPTION_CACHE_HAMMING = int(os.environ.get('CAPTION_CACHE_HAMMING', 3))
+CAPTION_CACHE_DB = os.environ.get('CAPTION_CACHE_DB', 'data/caption_cache.db')
+
+# Upload job pipeline
+JOB_DB = os.environ.get('JOB_DB', 'data/jobs.db')
+UPLOAD_WORKERS = int(os.environ.get('UPLOAD_WORKERS', 2))
+UPLOAD_WORKER_THREADS = int(os.environ.get('UPLOAD_WORKER_THREADS', 4))
+# Unfinished jobs without progress for JOB_TIMEOUT seconds are failed;
+# finished ones are deleted after JOB_RETENTION seconds
+JOB_TIMEOUT = float(os.environ.get('JOB_TIMEOUT', 600))
+JOB_RETENTION = float(os.environ.get('JOB_RETENTION', 24 * 3600))
+JOB_SUPERVISE_INTERVAL = float(os.environ.get('JOB_SUPERVISE_INTERVAL', 5))
+
+# Bulk ingestion
+BATCH_DIR = os.environ.get('BATCH_DIR', 'data/batches')
+INGEST_BATCH_SIZE = int(os.environ.get('INGEST_BATCH_SIZE', 8))
+BATCH_MAX_CONTENT_LENGTH = int(os.environ.get('BATCH_MAX_CONTENT_LENGTH', 512 * 1024 * 1024))
+# ZIP members larger than this uncompressed, or compressed more than this
+# ratio (images barely compress), are rejected before they are read
+BATCH_MAX_IMAGE_SIZE = int(os.environ.get('BATCH_MAX_IMAGE_SIZE', 16 * 1024 * 1024))
+BATCH_MAX_COMPRESSION_RATIO = float(os.environ.get('BATCH_MAX_COMPRESSION_RATIO', 100))
+
+# Optional JSON file replacing DescriptionGenerator keyword/template tables
+DESCRIPTION_RULES = os.environ.get('DESCRIPTION_RULES', '')
+
+# Model loading
+CAPTION_QUANTIZE = os.environ.get('CAPTION_QUANTIZE', '0') == '1'
+CAPTION_TORCHSCRIPT = os.environ.get('CAPTION_TORCHSCRIPT', '0') == '1'
+# Decoding preset (fast, balanced, quality) and intra-op threads per process
+CAPTION_PRESET = os.environ.get('CAPTION_PRESET', 'quality')
+CAPTION_THREADS = int(os.environ.get('CAPTION_THREADS', 0))
+# 'blip', or 'stub' for a model-free captioner that isolates web-tier cost
+CAPTIONER = os.environ.get('CAPTIONER', 'blip')
+# Simulated per-image inference time of the stub captioner
+STUB_CAPTION_DELAY_MS = float(os.environ.get('STUB_CAPTION_DELAY_MS', 0))
+# Load weights in the parent before job workers fork, sharing them copy-on-write
+MODEL_PRELOAD = os.environ.get('MODEL_PRELOAD', '0') == '1'
+MODEL_WARMUP = os.environ.get('MODEL_WARMUP', '1') == '1'
+
+# Model server mode: dedicated inference processes hold the captioner and
+# job workers send them images over Unix sockets instead of loading BLIP
+MODEL_SERVER = os.environ.get('MODEL_SERVER', '0') == '1'
+# Socket path; server i listens on <name>-<i><ext>
+MODEL_SERVER_SOCKET = os.environ.get('MODEL_SERVER_SOCKET', 'data/model-server.sock')
+MODEL_SERVER_PROCESSES = int(os.environ.get('MODEL_SERVER_PROCESSES', 1))
+# Start the servers with the app; 0 to run `python model_server.py` separately
+MODEL_SERVER_START = os.environ.get('MODEL_SERVER_START', '1') == '1'
+# Pin each server to its own share of the CPUs, with one intra-op thread per CPU
+MODEL_SERVER_PIN_CPUS = os.environ.get('MODEL_SERVER_PIN_CPUS', '1') == '1'
+# Shared key clients authenticate with; created with mode 0600 on first use
+MODEL_SERVER_AUTHKEY_FILE = os.environ.get('MODEL_SERVER_AUTHKEY_FILE', 'data/model-server.key')
+# Seconds between checks for dead servers, which are respawned
+MODEL_SERVER_SUPERVISE_INTERVAL = float(os.environ.get('MODEL_SERVER_SUPERVISE_INTERVAL', 5))
+
+# Metrics and profiling
+METRICS_DIR = os.environ.get('METRICS_DIR', 'data/metrics')
+# Fraction of requests and caption batches to profile (0 disables); traces go to PROFILE_DIR
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'data/profiles')
+# Use the torch profiler instead of cProfile for sampled caption batches
+PROFILE_TORCH = os.environ.get('PROFILE_TORCH', '0') == '1'
@@ -1,65 +1,155 @@
+import json
+import logging
+import re
+
+
+logger = logging.getLogger(__name__)
+
+# Built-in keyword and template tables. A JSON file with the same keys can
+# replace any of them; templates may use {caption} and {damage_type}.
+DEFAULT_RULES = {
+    "severity_keywords": {
+        "severe": ['severe', 'major', 'extensive', 'destroyed', 'broken', 'smashed', 'wrecked', 'totaled'],
+        "moderate": ['moderate', 'multiple', 'several', 'significant', 'damaged', 'dents', 'cracks'],
+        "minor": ['minor', 'small', 'slight', 'light', 'few', 'scratch', 'scratches']
+    },
+    "default_severity": "moderate",
+    "severity_phrases": {
+        "severe": "**SEVERE DAMAGE ASSESSMENT**: The inspection indicates extensive and critical damage affecting multiple structural or functional areas of the property. Immediate mitigation and safety measures are required.",
+        "moderate": "**MODERATE DAMAGE ASSESSMENT**: The inspection reveals notable damage that, while not catastrophic, demands professional repair and restoration. The extent of impairment may affect operational or residential usability until repairs are completed.",
+        "minor": "**MINOR DAMAGE ASSESSMENT**: The inspection identifies superficial or localized damage with limited functional impact. Repairs can be addressed through routine maintenance and corrective procedures."
+    },
+    "damage_templates": {
+        "fire damage": "Fire and smoke exposure have resulted in surface deterioration, soot accumulation, and thermal distress to key components. {caption}",
+        "water damage": "Prolonged moisture exposure has caused visible staining, swelling, or structural weakening in affected areas. {caption}",
+        "hail damage": "Impact marks and granule displacement from hail are visible across exposed surfaces. {caption}",
+        "flood damage": "Water intrusion has affected ground-level materials and electrical systems, requiring professional dehumidification and restoration. {caption}",
+        "collision damage": "Impact deformation and surface fracturing indicate substantial mechanical stress to the affected structure. {caption}",
+        "vandalism": "Intentional surface defacement and structural tampering are evident. {caption}",
+        "storm damage": "Wind, debris, and precipitation exposure have compromised external integrity and finish. {caption}",
+        "theft": "Signs of forced entry and material removal are observed, suggesting deliberate tampering. {caption}"
+    },
+    "default_template": "Observed damage corresponds with {damage_type} conditions. {caption}",
+    "recommendations": {
+        "severe": "**RECOMMENDATION**: Immediate intervention by certified restoration professionals is required. Full structural safety evaluation and phased reconstruction are strongly advised.",
+        "moderate": "**RECOMMENDATION**: Professional repair assessment, material replacement, and post-restoration verification are recommended to restore functional and visual integrity.",
+        "minor": "**RECOMMENDATION**: Routine maintenance and targeted repair should be scheduled to prevent progressive deterioration."
+    },
+    "default_recommendation": "**RECOMMENDATION**: Further professional evaluation is advised to determine corrective actions."
+}
+
+# Severity levels in the order they win when a caption matches several
+SEVERITY_ORDER = ("severe", "moderate", "minor")
+
+# Inflections a keyword may carry: 'severely', 'scratched', 'lights'
+KEYWORD_SUFFIXES = ('s', 'es', 'd', 'ed', 'ing', 'ly')
+
+
 class DescriptionGenerator:
-    def __init__(self):
-        print("✅ Description generator initialized!")
+    def __init__(self, rules_path=None):
+        rules = dict(DEFAULT_RULES)
+        if rules_path:
+            with open(rules_path, 'r') as f:
+                rules.update(json.load(f))
+        self._compile(rules)
+        logger.info("Description generator initialized")
+
+    def _compile(self, rules):
+        # One alternation with a named group per severity, matched from a
+        # word start so 'light' does not fire inside 'flight', and up to a
+        # word end through an optional inflection
+        keywords = rules["severity_keywords"]
+        groups = [
+            f"(?P<{severity}>{'|'.join(re.escape(k.lower()) for k in sorted(keywords.get(severity, []), key=len, reverse=True))})"
+            for severity in SEVERITY_ORDER if keywords.get(severity)
+        ]
+        suffixes = '|'.join(sorted(KEYWORD_SUFFIXES, key=len, reverse=True))
+        self.severity_pattern = (
+            re.compile(r"\b(?:" + "|".join(groups) + r")(?:" + suffixes + r")?\b") if groups else None
+        )
+        self.default_severity = rules["default_severity"]
+
+        # Static text is made ASCII once here; only the caption is per call
+        def ascii_text(text):
+            return text.encode("ascii", "ignore").decode()
+
+        self.severity_phrases = {k: ascii_text(v) for k, v in rules["severity_phrases"].items()}
+        self.damage_templates = {k.lower(): ascii_text(v) for k, v in rules["damage_templates"].items()}
+        self.default_template = ascii_text(rules["default_template"])
+        self.recommendations = {k: ascii_text(v) for k, v in rules["recommendations"].items()}
+        self.default_recommendation = ascii_text(rules["default_recommendation"])
 
     def enhance_description(self, image_caption, damage_type):
+        return self.assess(image_caption, damage_type)[0]
+
+    def assess(self, image_caption, damage_type):
+        """(description, severity) for one caption, from a single keyword scan"""
+        severity = self.assess_severity(image_caption)
+        return self._describe(image_caption, damage_type, severity), severity
+
+    def _describe(self, image_caption, damage_type, severity):
         try:
-            severity = self.assess_severity(image_caption)
-            description = self.create_professional_description(image_caption, damage_type, severity)
-            return description
+            return self.create_professional_description(image_caption, damage_type, severity)
         except Exception as e:
-            print(f"[Error in enhance_description]: {e}")
+            logger.warning("Error in enhance_description: %s", e)
             return f"Professional assessment confirms {damage_type}. {image_caption} Recommended: Detailed inspection by certified appraiser."
 
+    def assess_many(self, captions, damage_types):
+        """
+        Batch form of assess: a (description, severity) pair per caption.
+        `damage_types` is either one damage type for every caption or a
+        list aligned with `captions`. Captions repeat heavily in bulk
+        ingestion and re-analysis, so each distinct caption is scanned once
+        and each distinct (caption, damage type) described once.
+        """
+        if isinstance(damage_types, str):
+            damage_types = [damage_types] * len(captions)
+        severities = {}
+        assessed = {}
+        results = []
+        for caption, damage_type in zip(captions, damage_types):
+            key = (caption, damage_type)
+            if key not in assessed:
+                if caption not in severities:
+                    severities[caption] = self.assess_severity(caption)
+                severity = severities[caption]
+                assessed[key] = (self._describe(caption, damage_type, severity), severity)
+            results.append(assessed[key])
+        return results
+
     def assess_severity(self, caption):
-        caption_lower = caption.lower()
-        severe_keywords = ['severe', 'major', 'extensive', 'destroyed', 'broken', 'smashed', 'wrecked', 'totaled']
-        moderate_keywords = ['moderate', 'multiple', 'several', 'significant', 'damaged', 'dents', 'cracks']
-        minor_keywords = ['minor', 'small', 'slight', 'light', 'few', 'scratch', 'scratches']
-
-        if any(keyword in caption_lower for keyword in severe_keywords):
-            return "severe"
-        elif any(keyword in caption_lower for keyword in moderate_keywords):
-            return "moderate"
-        elif any(keyword in caption_lower for keyword in minor_keywords):
-            return "minor"
-        else:
-            return "moderate"
+        if self.severity_pattern is None:
+            return self.default_severity
+
+        text = caption.lower()
+        found = set()
+        qualified_from = None
+        for match in self.severity_pattern.finditer(text):
+            # An adverb sets the severity of the keyword it qualifies:
+            # 'lightly damaged' is minor, not moderate
+            if qualified_from is not None and not text[qualified_from:match.start()].strip():
+                qualified_from = None
+                continue
+            severity = match.lastgroup
+            is_adverb = match.group().endswith('ly') and not match.group(severity).endswith('ly')
+            qualified_from = match.end() if is_adverb else None
+            if severity == SEVERITY_ORDER[0]:
+                return severity
+            found.add(severity)
+        for severity in SEVERITY_ORDER:
+            if severity in found:
+                return severity
+        return self.default_severity
 
     def create_professional_description(self, caption, damage_type, severity):
-        severity_phrases = {
-            "severe": "**SEVERE DAMAGE ASSESSMENT**: The inspection indicates extensive and critical damage affecting multiple structural or functional areas of the property. Immediate mitigation and safety measures are required.",
-            "moderate": "**MODERATE DAMAGE ASSESSMENT**: The inspection reveals notable damage that, while not catastrophic, demands professional repair and restoration. The extent of impairment may affect operational or residential usability until repairs are completed.",
-            "minor": "**MINOR DAMAGE ASSESSMENT**: The inspection identifies superficial or localized damage with limited functional impact. Repairs can be addressed through routine maintenance and corrective procedures."
-        }
-
-        damage_specific = {
-            "fire damage": f"Fire and smoke exposure have resulted in surface deterioration, soot accumulation, and thermal distress to key components. {caption}",
-            "water damage": f"Prolonged moisture exposure has caused visible staining, swelling, or structural weakening in affected areas. {caption}",
-            "hail damage": f"Impact marks and granule displacement from hail are visible across exposed surfaces. {caption}",
-            "flood damage": f"Water intrusion has affected ground-level materials and electrical systems, requiring professional dehumidification and restoration. {caption}",
-            "collision damage": f"Impact deformation and surface fracturing indicate substantial mechanical stress to the affected structure. {caption}",
-            "vandalism": f"Intentional surface defacement and structural tampering are evident. {caption}",
-            "storm damage": f"Wind, debris, and precipitation exposure have compromised external integrity and finish. {caption}",
-            "theft": f"Signs of forced entry and material removal are observed, suggesting deliberate tampering. {caption}"
-        }
-
-        base_description = damage_specific.get(
-            damage_type.lower(),
-            f"Observed damage corresponds with {damage_type.lower()} conditions. {caption}"
+        caption = caption.encode("ascii", "ignore").decode()
+        damage_key = damage_type.lower()
+        template = self.damage_templates.get(damage_key, self.default_template)
+        base_description = template.format(
+            caption=caption,
+            damage_type=damage_key.encode("ascii", "ignore").decode()
         )
 
-        recommendations = {
-            "severe": "**RECOMMENDATION**: Immediate intervention by certified restoration professionals is required. Full structural safety evaluation and phased reconstruction are strongly advised.",
-            "moderate": "**RECOMMENDATION**: Professional repair assessment, material replacement, and post-restoration verification are recommended to restore functional and visual integrity.",
-            "minor": "**RECOMMENDATION**: Routine maintenance and targeted repair should be scheduled to prevent progressive deterioration."
-        }
-
-        recommendation = recommendations.get(
-            severity,
-            "**RECOMMENDATION**: Further professional evaluation is advised to determine corrective actions."
-        )
+        recommendation = self.recommendations.get(severity, self.default_recommendation)
 
-        full_text = f"{severity_phrases[severity]} {base_description} {recommendation}"
-        full_text = full_text.encode("ascii", "ignore").decode()
-        return full_text
+        return f"{self.severity_phrases[severity]} {base_description} {recommendation}"
@@ -0,0 +1,13 @@
+# gunicorn -c gunicorn.conf.py app:app
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('WEB_THREADS', 8))
+worker_class = 'gthread'
+timeout = 120
+
+# Import the app once in the master: the upload job pool (and, with
+# MODEL_PRELOAD=1, the model weights) is created before the web workers
+# fork, so they all share it instead of each loading BLIP.
+preload_app = True
@@ -0,0 +1,685 @@
+import base64
+import binascii
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+
+
+logger = logging.getLogger(__name__)
+
+# image_data holds base64 images of entries written before the image store
+HISTORY_COLUMNS = ('date', 'damage_type', 'image_caption', 'loss_description', 'image_hash', 'image_data', 'severity')
+SEARCH_COLUMNS = ('date', 'damage_type', 'severity', 'image_caption', 'loss_description', 'image_hash')
+
+# BM25 weights of the indexed columns; caption terms count double
+SEARCH_WEIGHTS = (2.0, 1.0)
+# Text search facets count at most this many matches; larger counts are lower bounds
+SEARCH_FACET_LIMIT = 10000
+
+
+def fts_query(text):
+    """
+    Turn free text into an FTS5 query matching every word; a trailing * on
+    a word matches it as a prefix. Returns None when `text` has no words.
+    """
+    terms = [
+        f'"{word.rstrip("*")}"' + ('*' if word.endswith('*') else '')
+        for word in re.findall(r'\w+\*?', text or '')
+    ]
+    return ' '.join(terms) or None
+
+
+class HistoryPage:
+    """
+    One page of history rows, newest first.
+
+    Rows are pulled lazily from `rows` so a streamed template never holds
+    more than one of them; `next_cursor` is only known once iteration ends.
+    """
+
+    def __init__(self, rows, limit):
+        self._rows = rows
+        self.limit = limit
+        self.has_more = False
+        self.next_cursor = None
+
+    def __iter__(self):
+        last_id = None
+        for index, row in enumerate(self._rows):
+            if index == self.limit:
+                self.has_more = True
+                self.next_cursor = last_id
+                break
+            last_id = row['id']
+            yield row
+
+
+class HistoryStore(ABC):
+    """Base class for assessment history backends"""
+
+    @abstractmethod
+    def add(self, entry):
+        ...
+
+    def add_many(self, entries):
+        for entry in entries:
+            self.add(entry)
+
+    def import_entries(self, source, entries):
+        """
+        Add `entries` unless `source` was imported before; return whether
+        they were added. Backends should record the import atomically with
+        the rows.
+        """
+        self.add_many(entries)
+        return True
+
+    @abstractmethod
+    def all(self):
+        ...
+
+    @abstractmethod
+    def count(self):
+        ...
+
+    @abstractmethod
+    def page(self, columns, limit, before_id=None, damage_type=None, date_from=None, date_to=None):
+        ...
+
+    @abstractmethod
+    def damage_types(self):
+        ...
+
+    @abstractmethod
+    def search(self, text=None, columns=SEARCH_COLUMNS, limit=50, cursor=None,
+               damage_type=None, severity=None, date_from=None, date_to=None, facets=True):
+        ...
+
+    def backfill_severity(self):
+        return 0
+
+    @abstractmethod
+    def iter_chunks(self, columns, chunk_size, after_id=0):
+        ...
+
+    @abstractmethod
+    def update_many(self, updates):
+        ...
+
+    @abstractmethod
+    def delete_duplicates(self):
+        ...
+
+    @abstractmethod
+    def image_hashes(self):
+        ...
+
+    def close(self):
+        pass
+
+
+class SQLiteHistoryStore(HistoryStore):
+    """
+    History backend on SQLite in WAL mode.
+
+    Appends are single-row inserts, so their cost does not grow with the
+    size of the history, and WAL lets several gunicorn workers write while
+    others read without losing entries.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._init_schema()
+
+    def _connect(self):
+        # One connection per thread and per process; sqlite connections must
+        # not be shared across threads or survive a fork.
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=30000')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _init_schema(self):
+        conn = self._connect()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                date TEXT NOT NULL,
+                damage_type TEXT NOT NULL,
+                image_caption TEXT,
+                loss_description TEXT,
+                image_hash TEXT,
+                image_data TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_history_date ON history(date);
+            CREATE INDEX IF NOT EXISTS idx_history_damage_type ON history(damage_type);
+            CREATE TABLE IF NOT EXISTS history_imports (
+                source TEXT PRIMARY KEY,
+                entries INTEGER NOT NULL,
+                imported_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+        existing = {row['name'] for row in conn.execute('PRAGMA table_info(history)')}
+        if 'image_hash' not in existing:
+            conn.execute('ALTER TABLE history ADD COLUMN image_hash TEXT')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_history_image_hash ON history(image_hash)')
+        if 'severity' not in existing:
+            conn.execute('ALTER TABLE history ADD COLUMN severity TEXT')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_history_severity ON history(severity)')
+        self._init_search(conn)
+        self.backfill_severity()
+
+    def _init_search(self, conn):
+        """
+        Create the full-text index and the facet count table, kept current by
+        triggers, and fill them from existing rows the first time. Runs in one
+        write transaction so workers starting together fill them only once.
+        """
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+            # Entries per day, damage type and severity: facet counts for
+            # unfiltered text read a few hundred rows instead of the history
+            if 'history_facets' not in tables:
+                conn.execute("""
+                    CREATE TABLE history_facets (
+                        day TEXT NOT NULL,
+                        damage_type TEXT NOT NULL,
+                        severity TEXT NOT NULL,
+                        entries INTEGER NOT NULL,
+                        PRIMARY KEY (day, damage_type, severity)
+                    ) WITHOUT ROWID
+                """)
+                conn.execute("""
+                    INSERT INTO history_facets
+                    SELECT substr(date, 1, 10), damage_type, coalesce(severity, ''), COUNT(*)
+                    FROM history GROUP BY 1, 2, 3
+                """)
+            conn.execute("""
+                CREATE TRIGGER IF NOT EXISTS history_facets_insert AFTER INSERT ON history BEGIN
+                    INSERT INTO history_facets VALUES (substr(new.date, 1, 10), new.damage_type, coalesce(new.severity, ''), 1)
+                    ON CONFLICT (day, damage_type, severity) DO UPDATE SET entries = entries + 1;
+                END
+            """)
+            conn.execute("""
+                CREATE TRIGGER IF NOT EXISTS history_facets_delete AFTER DELETE ON history BEGIN
+                    UPDATE history_facets SET entries = entries - 1
+                    WHERE day = substr(old.date, 1, 10) AND damage_type = old.damage_type AND severity = coalesce(old.severity, '');
+                END
+            """)
+            conn.execute("""
+                CREATE TRIGGER IF NOT EXISTS history_facets_update AFTER UPDATE OF date, damage_type, severity ON history BEGIN
+                    UPDATE history_facets SET entries = entries - 1
+                    WHERE day = substr(old.date, 1, 10) AND damage_type = old.damage_type AND severity = coalesce(old.severity, '');
+                    INSERT INTO history_facets VALUES (substr(new.date, 1, 10), new.damage_type, coalesce(new.severity, ''), 1)
+                    ON CONFLICT (day, damage_type, severity) DO UPDATE SET entries = entries + 1;
+                END
+            """)
+
+            # External-content FTS5 index over the text columns, stored once in history
+            self.full_text = 'history_fts' in tables
+            if not self.full_text:
+                try:
+                    conn.execute("""
+                        CREATE VIRTUAL TABLE history_fts USING fts5(
+                            image_caption, loss_description,
+                            content='history', content_rowid='id', tokenize='porter unicode61'
+                        )
+                    """)
+                    conn.execute("INSERT INTO history_fts(history_fts) VALUES ('rebuild')")
+                    self.full_text = True
+                except sqlite3.OperationalError as e:
+                    logger.warning("SQLite has no FTS5, text search falls back to LIKE scans: %s", e)
+            if self.full_text:
+                conn.execute("""
+                    CREATE TRIGGER IF NOT EXISTS history_fts_insert AFTER INSERT ON history BEGIN
+                        INSERT INTO history_fts(rowid, image_caption, loss_description)
+                        VALUES (new.id, new.image_caption, new.loss_description);
+                    END
+                """)
+                conn.execute("""
+                    CREATE TRIGGER IF NOT EXISTS history_fts_delete AFTER DELETE ON history BEGIN
+                        INSERT INTO history_fts(history_fts, rowid, image_caption, loss_description)
+                        VALUES ('delete', old.id, old.image_caption, old.loss_description);
+                    END
+                """)
+                conn.execute("""
+                    CREATE TRIGGER IF NOT EXISTS history_fts_update AFTER UPDATE OF image_caption, loss_description ON history BEGIN
+                        INSERT INTO history_fts(history_fts, rowid, image_caption, loss_description)
+                        VALUES ('delete', old.id, old.image_caption, old.loss_description);
+                        INSERT INTO history_fts(rowid, image_caption, loss_description)
+                        VALUES (new.id, new.image_caption, new.loss_description);
+                    END
+                """)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def backfill_severity(self):
+        """
+        Set the severity of entries written without one from the headline
+        of their description. Descriptions made with custom severity phrases
+        stay unassessed until `maintenance.py reanalyze` recomputes them.
+        """
+        from description_generator import DEFAULT_RULES, SEVERITY_ORDER
+
+        cases = []
+        params = []
+        for severity in SEVERITY_ORDER:
+            cases.append('WHEN loss_description LIKE ? THEN ?')
+            params += [DEFAULT_RULES['severity_phrases'][severity].split(':')[0] + '%', severity]
+        conn = self._connect()
+        cursor = conn.execute(
+            f"UPDATE history SET severity = CASE {' '.join(cases)} END "
+            "WHERE severity IS NULL AND loss_description IS NOT NULL",
+            params
+        )
+        return cursor.rowcount
+
+    def _row_values(self, entry):
+        return tuple(entry.get(column) for column in HISTORY_COLUMNS)
+
+    def add(self, entry):
+        conn = self._connect()
+        cursor = conn.execute(
+            f"INSERT INTO history ({', '.join(HISTORY_COLUMNS)}) VALUES ({', '.join('?' * len(HISTORY_COLUMNS))})",
+            self._row_values(entry)
+        )
+        return cursor.lastrowid
+
+    def add_many(self, entries):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(
+                f"INSERT INTO history ({', '.join(HISTORY_COLUMNS)}) VALUES ({', '.join('?' * len(HISTORY_COLUMNS))})",
+                (self._row_values(entry) for entry in entries)
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def import_entries(self, source, entries):
+        """Add `entries` and record `source` in one transaction, once per source"""
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if conn.execute('SELECT 1 FROM history_imports WHERE source = ?', (source,)).fetchone():
+                conn.execute('ROLLBACK')
+                return False
+            conn.executemany(
+                f"INSERT INTO history ({', '.join(HISTORY_COLUMNS)}) VALUES ({', '.join('?' * len(HISTORY_COLUMNS))})",
+                (self._row_values(entry) for entry in entries)
+            )
+            conn.execute('INSERT INTO history_imports (source, entries) VALUES (?, ?)', (source, len(entries)))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return True
+
+    def all(self):
+        conn = self._connect()
+        rows = conn.execute(f"SELECT id, {', '.join(HISTORY_COLUMNS)} FROM history ORDER BY id")
+        return [dict(row) for row in rows]
+
+    def count(self):
+        conn = self._connect()
+        return conn.execute('SELECT COUNT(*) FROM history').fetchone()[0]
+
+    def page(self, columns, limit, before_id=None, damage_type=None, date_from=None, date_to=None):
+        """
+        Return a HistoryPage of at most `limit` entries older than `before_id`.
+
+        Only `columns` are read, so callers that display text never pull the
+        image blobs off disk. Pagination is keyset-based on the row id.
+        """
+        unknown = set(columns) - set(HISTORY_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown history columns: {', '.join(sorted(unknown))}")
+
+        conditions = []
+        params = []
+        if before_id is not None:
+            conditions.append('id < ?')
+            params.append(before_id)
+        if damage_type:
+            conditions.append('damage_type = ?')
+            params.append(damage_type)
+        if date_from:
+            conditions.append('date >= ?')
+            params.append(date_from)
+        if date_to:
+            conditions.append('date <= ?')
+            params.append(date_to)
+
+        query = f"SELECT id, {', '.join(columns)} FROM history"
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY id DESC LIMIT ?'
+        params.append(limit + 1)
+
+        conn = self._connect()
+        rows = (dict(row) for row in conn.execute(query, params))
+        return HistoryPage(rows, limit)
+
+    def damage_types(self):
+        """Damage types with at least one entry, read from the small history_facets table"""
+        conn = self._connect()
+        return [row[0] for row in conn.execute(
+            'SELECT damage_type FROM history_facets GROUP BY damage_type HAVING SUM(entries) > 0 ORDER BY damage_type'
+        )]
+
+    def _search_filters(self, damage_type, severity, date_from, date_to):
+        conditions = []
+        params = []
+        for column, operator, value in (('damage_type', '=', damage_type), ('severity', '=', severity),
+                                        ('date', '>=', date_from), ('date', '<=', date_to)):
+            if value:
+                conditions.append(f'h.{column} {operator} ?')
+                params.append(value)
+        return conditions, params
+
+    def _text_matches(self, text):
+        """A query selecting the ids of entries containing every word of `text`, and its params"""
+        if self.full_text:
+            return 'SELECT rowid AS id FROM history_fts WHERE history_fts MATCH ?', [fts_query(text)]
+        conditions = []
+        params = []
+        for word in re.findall(r'\w+', text):
+            conditions.append('(image_caption LIKE ? OR loss_description LIKE ?)')
+            params += [f'%{word}%', f'%{word}%']
+        return f"SELECT id FROM history WHERE {' AND '.join(conditions)}", params
+
+    def _text_facet_counts(self, text, date_from, date_to):
+        """
+        (damage_type, severity, entries) groups of up to SEARCH_FACET_LIMIT
+        text matches within the dates, and whether matches were left out
+        """
+        matches, match_params = self._text_matches(text)
+        conn = self._connect()
+        capped = conn.execute(f"SELECT COUNT(*) FROM ({matches} LIMIT ?)",
+                              match_params + [SEARCH_FACET_LIMIT + 1]).fetchone()[0] > SEARCH_FACET_LIMIT
+        conditions, params = self._search_filters(None, None, date_from, date_to)
+        query = (f"SELECT h.damage_type, coalesce(h.severity, ''), COUNT(*) "
+                 f"FROM ({matches} LIMIT ?) m JOIN history h ON h.id = m.id")
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' GROUP BY 1, 2'
+        return conn.execute(query, match_params + [SEARCH_FACET_LIMIT] + params).fetchall(), capped
+
+    def _facet_counts(self, date_from, date_to):
+        """(damage_type, severity, entries) groups of the rows within the dates"""
+        conditions, params = self._search_filters(None, None, date_from, date_to)
+        query = "SELECT h.damage_type, coalesce(h.severity, ''), COUNT(*) FROM history h"
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' GROUP BY 1, 2'
+        return self._connect().execute(query, params).fetchall()
+
+    def _stored_facet_counts(self, date_from, date_to):
+        """The same groups read from history_facets; the date filters must cover whole days"""
+        conditions = []
+        params = []
+        if date_from:
+            conditions.append('day >= ?')
+            params.append(date_from[:10])
+        if date_to:
+            conditions.append('day <= ?')
+            params.append(date_to[:10])
+        query = 'SELECT damage_type, severity, SUM(entries) FROM history_facets'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' GROUP BY 1, 2'
+        return self._connect().execute(query, params).fetchall()
+
+    @staticmethod
+    def _fold_facets(groups, damage_type, severity):
+        # One grouped pass serves both facets; each applies only the other's filter
+        facets = {'damage_type': {}, 'severity': {}}
+        for group_type, group_severity, entries in groups:
+            if not entries:
+                continue
+            if not severity or group_severity == severity:
+                facets['damage_type'][group_type] = facets['damage_type'].get(group_type, 0) + entries
+            if not damage_type or group_type == damage_type:
+                facets['severity'][group_severity] = facets['severity'].get(group_severity, 0) + entries
+        return facets
+
+    def search(self, text=None, columns=SEARCH_COLUMNS, limit=50, cursor=None,
+               damage_type=None, severity=None, date_from=None, date_to=None, facets=True):
+        """
+        Find entries and count them per damage type and severity.
+
+        With `text`, entries containing every word are ranked by BM25 over
+        caption and description and `cursor` is an offset; without it they
+        come newest first and `cursor` is the keyset id, as in page(). Each
+        facet ignores its own filter so the other choices stay visible.
+        Text facets count at most SEARCH_FACET_LIMIT matches, flagged by
+        'facets_capped'; `facets=False` skips counting, and 'total' and
+        'facets' are then None. Returns {'entries', 'total', 'facets',
+        'facets_capped', 'next_cursor'}.
+        """
+        unknown = set(columns) - set(HISTORY_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown history columns: {', '.join(sorted(unknown))}")
+
+        conditions, params = self._search_filters(damage_type, severity, date_from, date_to)
+        selected = ', '.join(f'h.{column}' for column in columns)
+        conn = self._connect()
+        capped = False
+
+        if fts_query(text):
+            offset = cursor or 0
+            matches, match_params = self._text_matches(text)
+            if self.full_text and not conditions:
+                # Rank and cut in the FTS index, then join only one page of rows to history
+                weights = ', '.join(str(weight) for weight in SEARCH_WEIGHTS)
+                query = (f"SELECT h.id, {selected}, m.score FROM ("
+                         f"SELECT rowid, bm25(history_fts, {weights}) AS score FROM history_fts "
+                         f"WHERE history_fts MATCH ? ORDER BY score, rowid DESC LIMIT ? OFFSET ?"
+                         f") m JOIN history h ON h.id = m.rowid ORDER BY m.score, h.id DESC")
+                query_params = match_params + [limit + 1, offset]
+            elif self.full_text:
+                # Filters on history columns must apply before the page is cut
+                weights = ', '.join(str(weight) for weight in SEARCH_WEIGHTS)
+                query = (f"SELECT h.id, {selected}, bm25(history_fts, {weights}) AS score "
+                         f"FROM history_fts JOIN history h ON h.id = history_fts.rowid "
+                         f"WHERE history_fts MATCH ? AND {' AND '.join(conditions)} "
+                         f"ORDER BY score, h.id DESC LIMIT ? OFFSET ?")
+                query_params = match_params + params + [limit + 1, offset]
+            else:
+                query = (f"SELECT h.id, {selected} FROM history h "
+                         f"WHERE {' AND '.join(conditions + [f'h.id IN ({matches})'])} "
+                         f"ORDER BY h.id DESC LIMIT ? OFFSET ?")
+                query_params = params + match_params + [limit + 1, offset]
+            rows = conn.execute(query, query_params).fetchall()
+            next_cursor = offset + limit if len(rows) > limit else None
+            if facets:
+                groups, capped = self._text_facet_counts(text, date_from, date_to)
+        else:
+            if cursor is not None:
+                conditions.append('h.id < ?')
+                params.append(cursor)
+            where = ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+            rows = conn.execute(
+                f"SELECT h.id, {selected} FROM history h{where} ORDER BY h.id DESC LIMIT ?",
+                params + [limit + 1]
+            ).fetchall()
+            next_cursor = rows[limit - 1]['id'] if len(rows) > limit else None
+            whole_days = ((not date_from or len(date_from) == 10 or date_from.endswith(' 00:00:00'))
+                          and (not date_to or date_to.endswith(' 23:59:59')))
+            if facets and whole_days:
+                groups = self._stored_facet_counts(date_from, date_to)
+            elif facets:
+                groups = self._facet_counts(date_from, date_to)
+
+        counts = total = None
+        if facets:
+            counts = self._fold_facets(groups, damage_type, severity)
+            type_counts = counts['damage_type']
+            total = type_counts.get(damage_type, 0) if damage_type else sum(type_counts.values())
+        return {
+            'entries': [dict(row) for row in rows[:limit]],
+            'total': total,
+            'facets': counts,
+            'facets_capped': capped,
+            'next_cursor': next_cursor
+        }
+
+    def iter_chunks(self, columns, chunk_size, after_id=0):
+        """Yield lists of up to `chunk_size` entries in id order, starting after `after_id`"""
+        unknown = set(columns) - set(HISTORY_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown history columns: {', '.join(sorted(unknown))}")
+        conn = self._connect()
+        while True:
+            rows = conn.execute(
+                f"SELECT id, {', '.join(columns)} FROM history WHERE id > ? ORDER BY id LIMIT ?",
+                (after_id, chunk_size)
+            ).fetchall()
+            if not rows:
+                return
+            chunk = [dict(row) for row in rows]
+            after_id = chunk[-1]['id']
+            yield chunk
+
+    def update_many(self, updates):
+        """Apply {'id': ..., column: value, ...} updates in one transaction"""
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for update in updates:
+                columns = [column for column in update if column != 'id']
+                unknown = set(columns) - set(HISTORY_COLUMNS)
+                if unknown:
+                    raise ValueError(f"Unknown history columns: {', '.join(sorted(unknown))}")
+                conn.execute(
+                    f"UPDATE history SET {', '.join(f'{column} = ?' for column in columns)} WHERE id = ?",
+                    [update[column] for column in columns] + [update['id']]
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def delete_duplicates(self):
+        """Delete entries identical to an older one and return how many were removed"""
+        conn = self._connect()
+        cursor = conn.execute(f"""
+            DELETE FROM history WHERE id NOT IN (
+                SELECT MIN(id) FROM history
+                GROUP BY {', '.join(HISTORY_COLUMNS)}
+            )
+        """)
+        return cursor.rowcount
+
+    def image_hashes(self):
+        conn = self._connect()
+        return {row[0] for row in conn.execute('SELECT DISTINCT image_hash FROM history WHERE image_hash IS NOT NULL')}
+
+    def vacuum(self):
+        conn = self._connect()
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        conn.execute('VACUUM')
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+HISTORY_BACKENDS = {
+    'sqlite': SQLiteHistoryStore,
+}
+
+
+def create_history_store(backend, path):
+    """Build the history backend registered under `backend`"""
+    try:
+        store_class = HISTORY_BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f"Unknown history backend: {backend}")
+    return store_class(path)
+
+
+def move_image_data(entry, image_store):
+    """Move an entry's base64 image_data into `image_store`, keeping only the hash"""
+    image_data = entry.pop('image_data', None)
+    if image_data and not entry.get('image_hash'):
+        try:
+            entry['image_hash'] = image_store.put(base64.b64decode(image_data))
+        except (binascii.Error, ValueError) as e:
+            logger.warning("Dropping undecodable image for entry dated %s: %s", entry.get('date'), e)
+    return entry
+
+
+def migrate_json_history(json_path, store, image_store=None):
+    """
+    Import a legacy whole-file JSON history into `store` once.
+
+    The rows and an import marker for the file are written in one
+    transaction, so when several workers start at the same time only one
+    of them imports it. The file is renamed to .migrated only after that
+    commit; if reading or inserting fails it stays in place and the import
+    is retried on the next start. With an `image_store`, embedded base64
+    images are moved into it. Returns the number of imported entries.
+    """
+    try:
+        with open(json_path, 'r') as f:
+            entries = json.load(f)
+    except FileNotFoundError:
+        return 0
+    except (OSError, ValueError) as e:
+        logger.error("Could not read legacy history %s, will retry on next start: %s", json_path, e)
+        return 0
+
+    if image_store is not None:
+        entries = [move_image_data(entry, image_store) for entry in entries]
+    imported = store.import_entries(os.path.realpath(json_path), entries)
+    try:
+        os.rename(json_path, json_path + '.migrated')
+    except FileNotFoundError:
+        pass  # renamed by a worker that imported it at the same time
+    if not imported:
+        return 0
+    store.backfill_severity()
+    return len(entries)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Migrate a JSON detection history into a history store')
+    parser.add_argument('json_path', help='legacy history file, e.g. data/detection_history.json')
+    parser.add_argument('--backend', default='sqlite')
+    parser.add_argument('--db', default='data/history.db')
+    parser.add_argument('--images', default='data/images', help='image store directory for embedded images')
+    args = parser.parse_args()
+
+    from image_store import ImageStore
+
+    imported = migrate_json_history(
+        args.json_path,
+        create_history_store(args.backend, args.db),
+        ImageStore(args.images)
+    )
+    print(f"✅ Migrated {imported} history entries into {args.db}")
@@ -0,0 +1,145 @@
+import hashlib
+import os
+import re
+import tempfile
+
+
+HASH_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+VARIANT_PATTERN = re.compile(r'^[a-z]+$')
+BLOB_PATTERN = re.compile(r'^([0-9a-f]{64})(?:\.[a-z]+)?$')
+
+# Leading bytes of the formats accepted by the upload form
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+)
+
+
+def hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def sniff_mimetype(header):
+    for signature, mimetype in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return mimetype
+    return 'application/octet-stream'
+
+
+class ImageStore:
+    """
+    Content-addressed image blobs keyed by the SHA-256 of their bytes.
+
+    Blobs live at <root>/<first two hex chars>/<hash>, so the same photo
+    uploaded for several claims is stored once. Derived variants of a
+    photo (see ingest.build_variants) sit next to it as <hash>.<variant>
+    and stay keyed by the original's hash even when the original itself
+    is not kept.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, image_hash, variant=None):
+        if not HASH_PATTERN.match(image_hash or ''):
+            raise ValueError(f"Invalid image hash: {image_hash}")
+        path = os.path.join(self.root, image_hash[:2], image_hash)
+        if variant is None:
+            return path
+        if not VARIANT_PATTERN.match(variant):
+            raise ValueError(f"Invalid image variant: {variant}")
+        return f"{path}.{variant}"
+
+    def exists(self, image_hash, variant=None):
+        try:
+            return os.path.exists(self.path(image_hash, variant))
+        except ValueError:
+            return False
+
+    def find(self, image_hash, *variants):
+        """
+        Return the first of `variants` stored for `image_hash` (None meaning
+        the original) as (variant, path); raise FileNotFoundError if none is
+        """
+        for variant in variants:
+            if self.exists(image_hash, variant):
+                return variant, self.path(image_hash, variant)
+        raise FileNotFoundError(f"No stored image for {image_hash}")
+
+    def put(self, data):
+        """Store `data` unless an identical blob exists and return its hash"""
+        image_hash = hash_bytes(data)
+        self._write(self.path(image_hash), data)
+        return image_hash
+
+    def put_variant(self, image_hash, variant, data):
+        """Store a derived variant of the image whose original hashes to `image_hash`"""
+        self._write(self.path(image_hash, variant), data)
+
+    def _write(self, path, data):
+        if os.path.exists(path):
+            return
+
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # Write to a temp file first so readers never see a partial blob
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def get(self, image_hash, variant=None):
+        with open(self.path(image_hash, variant), 'rb') as f:
+            return f.read()
+
+    def mimetype(self, image_hash, variant=None):
+        with open(self.path(image_hash, variant), 'rb') as f:
+            return sniff_mimetype(f.read(8))
+
+    def _blobs(self, image_hash):
+        directory = os.path.dirname(self.path(image_hash))
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            return []
+        return [os.path.join(directory, name) for name in names
+                if BLOB_PATTERN.match(name) and name.startswith(image_hash)]
+
+    def mtime(self, image_hash):
+        """Modification time of the newest blob (original or variant) of `image_hash`"""
+        return max((os.path.getmtime(path) for path in self._blobs(image_hash)), default=0)
+
+    def delete_variant(self, image_hash, variant):
+        try:
+            os.remove(self.path(image_hash, variant))
+        except FileNotFoundError:
+            pass
+
+    def delete(self, image_hash):
+        """Delete the original and every variant"""
+        for path in self._blobs(image_hash):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def hashes(self):
+        """Hashes with at least one stored blob"""
+        for prefix in os.listdir(self.root):
+            directory = os.path.join(self.root, prefix)
+            if not os.path.isdir(directory):
+                continue
+            seen = set()
+            for name in os.listdir(directory):
+                match = BLOB_PATTERN.match(name)
+                if match and match.group(1) not in seen:
+                    seen.add(match.group(1))
+                    yield match.group(1)
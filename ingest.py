@@ -0,0 +1,122 @@
+from io import BytesIO
+
+from PIL import Image
+
+from image_store import hash_bytes
+
+
+# BLIP resizes every image to 384x384; decoding larger is wasted work
+MODEL_INPUT_SIZE = (384, 384)
+
+# Stored per upload instead of the original: the exact model input, a
+# thumbnail for display and the size ReportEngine embeds (2x its 300x200 box)
+THUMBNAIL_SIZE = (320, 320)
+PDF_IMAGE_SIZE = (600, 400)
+VARIANT_QUALITY = {'model': 95, 'pdf': 85, 'thumb': 80}
+IMAGE_VARIANTS = tuple(VARIANT_QUALITY)
+
+# Upload bytes stored by the web tier until their job has built the variants
+STAGED_VARIANT = 'upload'
+
+
+def verify_image(data):
+    """Raise if `data` is not a readable image; parses headers without decoding pixels"""
+    with Image.open(BytesIO(data)) as img:
+        img.verify()
+
+
+def decode_image(source, size=MODEL_INPUT_SIZE):
+    """
+    Decode image bytes or a path to RGB once, at no more than needed for `size`.
+
+    JPEGs use draft mode, so libjpeg decodes directly at 1/2, 1/4 or 1/8
+    scale while staying at least `size`; other formats decode in full.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = BytesIO(source)
+    with Image.open(source) as img:
+        img.draft('RGB', size)
+        return img.convert('RGB')
+
+
+def _encode_jpeg(image, quality):
+    buffer = BytesIO()
+    image.save(buffer, 'JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def build_variants(data):
+    """
+    Decode upload bytes once and derive every stored variant from it.
+
+    Returns (model_image, {variant: JPEG bytes}). The decode uses draft
+    mode at the largest variant size; 'model' is the image squashed to
+    MODEL_INPUT_SIZE exactly as the BLIP processor would, 'pdf' fits
+    PDF_IMAGE_SIZE and 'thumb' is scaled down from 'pdf'. Resizing uses
+    bilinear filtering after a box reduce (reducing_gap), which is much
+    cheaper than a bicubic pass over the full image.
+    """
+    with Image.open(BytesIO(data)) as img:
+        img.draft('RGB', (max(MODEL_INPUT_SIZE[0], PDF_IMAGE_SIZE[0]), max(MODEL_INPUT_SIZE[1], PDF_IMAGE_SIZE[1])))
+        img = img.convert('RGB')
+
+    model_image = img.resize(MODEL_INPUT_SIZE, Image.Resampling.BILINEAR, reducing_gap=2.0)
+    pdf_image = img.copy()
+    pdf_image.thumbnail(PDF_IMAGE_SIZE, Image.Resampling.BILINEAR, reducing_gap=2.0)
+    thumb_image = pdf_image.copy()
+    thumb_image.thumbnail(THUMBNAIL_SIZE, Image.Resampling.BILINEAR, reducing_gap=2.0)
+
+    images = {'model': model_image, 'pdf': pdf_image, 'thumb': thumb_image}
+    return model_image, {name: _encode_jpeg(images[name], quality) for name, quality in VARIANT_QUALITY.items()}
+
+
+def ingest_image(image_store, data, archive_original=False):
+    """
+    Store the variants of an uploaded image, and the original bytes only
+    when `archive_original` is set. Variants of a photo stored before are
+    not rebuilt. Returns (image hash, model image): the hash is the SHA-256
+    of the original bytes, and the decoded model input is returned so it
+    can be captioned without a JPEG round trip; it is None when the
+    variants already existed.
+    """
+    image_hash = hash_bytes(data)
+    model_image = None
+    if not all(image_store.exists(image_hash, variant) for variant in IMAGE_VARIANTS):
+        model_image, variants = build_variants(data)
+        for variant, variant_data in variants.items():
+            image_store.put_variant(image_hash, variant, variant_data)
+    if archive_original:
+        image_store.put(data)
+    return image_hash, model_image
+
+
+def stage_upload(image_store, data):
+    """
+    Store upload bytes as they are for ingest_staged, so a web request only
+    hashes and writes them. Returns the image hash.
+    """
+    image_hash = hash_bytes(data)
+    image_store.put_variant(image_hash, STAGED_VARIANT, data)
+    return image_hash
+
+
+def ingest_staged(image_store, image_hash, archive_original=False):
+    """
+    ingest_image for bytes stored by stage_upload; runs in the upload job.
+    The staged copy is removed afterwards, also when the bytes do not
+    decode (raised as ValueError).
+    """
+    try:
+        try:
+            data = image_store.get(image_hash, STAGED_VARIANT)
+        except FileNotFoundError:
+            # A job for the same bytes finished first and removed the staged copy
+            if all(image_store.exists(image_hash, variant) for variant in IMAGE_VARIANTS):
+                return image_hash, None
+            raise
+        try:
+            return ingest_image(image_store, data, archive_original)
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            raise ValueError(f"Invalid image file: {e}") from e
+    finally:
+        image_store.delete_variant(image_hash, STAGED_VARIANT)
@@ -0,0 +1,350 @@
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+from metrics import registry, span
+
+
+logger = logging.getLogger(__name__)
+
+JOB_STATUSES = ('queued', 'running', 'done', 'failed')
+
+
+class JobStore:
+    """
+    Upload job state in SQLite, so any web worker can answer status polls
+    for a job enqueued by another one
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                stage TEXT,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        existing = {row['name'] for row in conn.execute('PRAGMA table_info(jobs)')}
+        if 'worker_pid' not in existing:
+            conn.execute('ALTER TABLE jobs ADD COLUMN worker_pid INTEGER')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status_updated ON jobs(status, updated_at)')
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def create(self, job_id=None):
+        job_id = job_id or uuid.uuid4().hex
+        now = time.time()
+        self._connect().execute(
+            'INSERT INTO jobs (id, status, created_at, updated_at) VALUES (?, ?, ?, ?)',
+            (job_id, 'queued', now, now)
+        )
+        return job_id
+
+    def update(self, job_id, status=None, stage=None, result=None, error=None, worker_pid=None, expect=None):
+        """
+        Update a job and refresh its lease. With `expect`, only a job still
+        in that status is changed; returns whether a row was updated.
+        """
+        fields = {'updated_at': time.time()}
+        if status is not None:
+            fields['status'] = status
+        if stage is not None:
+            fields['stage'] = stage
+        if result is not None:
+            fields['result'] = json.dumps(result)
+        if error is not None:
+            fields['error'] = error
+        if worker_pid is not None:
+            fields['worker_pid'] = worker_pid
+        assignments = ', '.join(f'{name} = ?' for name in fields)
+        condition = 'id = ?'
+        params = list(fields.values()) + [job_id]
+        if expect is not None:
+            condition += ' AND status = ?'
+            params.append(expect)
+        cursor = self._connect().execute(f'UPDATE jobs SET {assignments} WHERE {condition}', params)
+        return cursor.rowcount > 0
+
+    def get(self, job_id):
+        row = self._connect().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def fail_worker_jobs(self, worker_pid, error):
+        """Fail the unfinished jobs a dead worker process had taken"""
+        cursor = self._connect().execute(
+            "UPDATE jobs SET status = 'failed', error = ?, updated_at = ? "
+            "WHERE worker_pid = ? AND status IN ('queued', 'running')",
+            (error, time.time(), worker_pid)
+        )
+        return cursor.rowcount
+
+    def fail_stale(self, timeout):
+        """Fail unfinished jobs whose lease (last update) is older than `timeout` seconds"""
+        now = time.time()
+        cursor = self._connect().execute(
+            "UPDATE jobs SET status = 'failed', error = ?, updated_at = ? "
+            "WHERE status IN ('queued', 'running') AND updated_at < ?",
+            (f'Job made no progress for {timeout:.0f}s', now, now - timeout)
+        )
+        return cursor.rowcount
+
+    def prune(self, retention):
+        """Delete finished jobs last updated more than `retention` seconds ago"""
+        cursor = self._connect().execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?",
+            (time.time() - retention,)
+        )
+        return cursor.rowcount
+
+
+def run_job(job_store, job_id, payload):
+    """Run one upload job inside a worker process and record its outcome"""
+    import pipeline
+
+    if payload.get('kind') == 'batch':
+        return run_batch_job(job_store, job_id, payload)
+    try:
+        if not job_store.update(job_id, status='running', expect='queued'):
+            logger.warning("Skipping upload job %s: no longer queued", job_id)
+            return
+        with span('job', 'total'):
+            result = pipeline.process_upload(
+                payload['image_hash'],
+                payload['damage_type'],
+                payload['filename'],
+                preset=payload.get('preset'),
+                archive_original=payload.get('archive_original', False),
+                on_stage=lambda stage: job_store.update(job_id, stage=stage)
+            )
+        job_store.update(job_id, status='done', stage='done', result=result, expect='running')
+    except Exception as e:
+        logger.exception("Error in upload job %s", job_id)
+        job_store.update(job_id, status='failed', error=str(e), expect='running')
+
+
+def _remove_batch_source(source):
+    """Delete an uploaded batch's archive or image directory; results and summary stay"""
+    try:
+        if os.path.isdir(source):
+            shutil.rmtree(source)
+        else:
+            os.remove(source)
+    except FileNotFoundError:
+        pass
+
+
+def run_batch_job(job_store, job_id, payload):
+    """
+    Ingest an uploaded batch with this worker's models; progress refreshes
+    the job's lease. The uploaded source is deleted once the job ends.
+    """
+    from batch_ingest import run_batch
+
+    try:
+        if not job_store.update(job_id, status='running', stage='ingest', expect='queued'):
+            logger.warning("Skipping batch job %s: no longer queued", job_id)
+            return
+        summary = run_batch(
+            payload['source'],
+            payload['results_path'],
+            payload['damage_type'],
+            payload['batch_size'],
+            on_progress=lambda counts: job_store.update(job_id, stage='ingest')
+        )
+        job_store.update(job_id, status='done', stage='done', result=summary, expect='running')
+    except Exception as e:
+        logger.exception("Error in batch job %s", job_id)
+        job_store.update(job_id, status='failed', error=str(e), expect='running')
+    finally:
+        _remove_batch_source(payload['source'])
+
+
+def _worker_main(task_queue, ready, job_db, threads, warm_up):
+    import pipeline
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(process)d %(name)s %(levelname)s %(message)s')
+    registry.start_flusher()
+    if warm_up:
+        try:
+            captioner, _ = pipeline.get_models()
+            captioner.warm_up()
+        except Exception as e:
+            logger.warning("Model warm-up failed: %s", e)
+    ready.set()
+
+    # Several uploads in flight per process lets the caption batcher group
+    # them; batches run one at a time per process next to the uploads. A
+    # task is only taken off the shared queue when one of `threads` slots
+    # is free, so the backlog waits there for whichever worker is idle.
+    job_store = JobStore(job_db)
+    slots = threading.Semaphore(threads)
+    with ThreadPoolExecutor(max_workers=threads) as executor, ThreadPoolExecutor(max_workers=1) as batches:
+        while True:
+            slots.acquire()
+            task = task_queue.get()
+            if task is None:
+                break
+            # Lets the supervisor fail this job if the process dies
+            job_store.update(task[0], worker_pid=os.getpid(), expect='queued')
+            future = (batches if task[1].get('kind') == 'batch' else executor).submit(run_job, job_store, *task)
+            future.add_done_callback(lambda _: slots.release())
+
+
+class JobQueue:
+    """
+    Local process pool for upload jobs; no external broker.
+
+    Web requests put (job_id, payload) on a multiprocessing queue and
+    return immediately; each worker process takes up to `threads` jobs at
+    a time, at most one of them a batch ingestion (payload kind 'batch'),
+    all on the process's one set of models. By default workers are
+    spawned and load their own models. With `fork=True` they are forked
+    from a parent that already holds the weights, so all workers share one copy copy-on-write; the parent must
+    not have run inference yet. Started before gunicorn forks (preload_app),
+    one pool is shared by every web worker.
+
+    A supervisor thread in the starting process respawns workers that
+    died and fails the jobs they had taken, fails jobs without progress
+    for `job_timeout` seconds and deletes finished jobs after
+    `job_retention` seconds.
+    """
+
+    def __init__(self, job_store, workers=2, threads=4, fork=False, warm_up=True,
+                 job_timeout=600, job_retention=24 * 3600, supervise_interval=5):
+        self.job_store = job_store
+        self.workers = workers
+        self.threads = threads
+        self.warm_up = warm_up
+        self.job_timeout = job_timeout
+        self.job_retention = job_retention
+        self.supervise_interval = supervise_interval
+        self._context = multiprocessing.get_context('fork' if fork else 'spawn')
+        self._ready = self._context.Event()
+        self._queue = None
+        self._processes = []
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        # gunicorn may fork a web worker while the supervisor holds the lock
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset_lock)
+
+    def _reset_lock(self):
+        self._lock = threading.Lock()
+
+    def _spawn(self, index):
+        process = self._context.Process(
+            target=_worker_main,
+            args=(self._queue, self._ready, self.job_store.path, self.threads, self.warm_up),
+            name=f'upload-worker-{index}',
+            daemon=True
+        )
+        process.start()
+        return process
+
+    def start(self):
+        with self._lock:
+            if self._queue is not None:
+                return
+            self._queue = self._context.Queue()
+            self._processes = [self._spawn(index) for index in range(self.workers)]
+            self._stopping.clear()
+            threading.Thread(target=self._supervise, name='job-supervisor', daemon=True).start()
+
+    def _supervise(self):
+        while not self._stopping.wait(self.supervise_interval):
+            try:
+                self._respawn_dead_workers()
+                stale = self.job_store.fail_stale(self.job_timeout)
+                if stale:
+                    logger.warning("Failed %d jobs without progress for %.0fs", stale, self.job_timeout)
+                self.job_store.prune(self.job_retention)
+            except Exception:
+                logger.exception("Job supervisor check failed")
+
+    def _respawn_dead_workers(self):
+        with self._lock:
+            if self._queue is None or self._stopping.is_set():
+                return
+            for index, process in enumerate(self._processes):
+                if process.is_alive():
+                    continue
+                failed = self.job_store.fail_worker_jobs(
+                    process.pid, f'Upload worker exited with code {process.exitcode}')
+                logger.warning("Upload worker %s (pid %s) exited with code %s; failed %d of its jobs, respawning",
+                               process.name, process.pid, process.exitcode, failed)
+                self._processes[index] = self._spawn(index)
+
+    def submit(self, payload, job_id=None):
+        if self._queue is None:
+            self.start()
+        job_id = self.job_store.create(job_id)
+        self._queue.put((job_id, payload))
+        return job_id
+
+    def ready(self):
+        """True once at least one worker has its models loaded and warmed up"""
+        return self._ready.is_set()
+
+    def queue_depth(self):
+        if self._queue is None:
+            return 0
+        try:
+            return self._queue.qsize()
+        except NotImplementedError:
+            return None
+
+    def stop(self):
+        self._stopping.set()
+        with self._lock:
+            if self._queue is None:
+                return
+            for _ in self._processes:
+                self._queue.put(None)
+            for process in self._processes:
+                process.join(timeout=10)
+            self._processes = []
+            self._queue = None
+
+
+def create_job_queue():
+    return JobQueue(
+        JobStore(config.JOB_DB),
+        config.UPLOAD_WORKERS,
+        config.UPLOAD_WORKER_THREADS,
+        fork=config.MODEL_PRELOAD,
+        warm_up=config.MODEL_WARMUP,
+        job_timeout=config.JOB_TIMEOUT,
+        job_retention=config.JOB_RETENTION,
+        supervise_interval=config.JOB_SUPERVISE_INTERVAL
+    )
@@ -0,0 +1,213 @@
+"""
+Offline maintenance for the assessment history.
+
+    python maintenance.py reanalyze [--recaption] [--workers 4]
+    python maintenance.py compact [--min-age-hours 24] [--vacuum]
+
+`reanalyze` re-runs DescriptionGenerator (and optionally BLIP) over every
+stored entry after the rules or model change, writing results back chunk
+by chunk and recording the last finished id in a checkpoint file, so an
+interrupted run resumes where it stopped. `compact` removes duplicate
+entries and image blobs no history row references.
+"""
+import argparse
+import base64
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+
+import config
+from history_store import create_history_store
+from image_store import ImageStore
+
+
+logger = logging.getLogger(__name__)
+
+# Each recaptioning worker without a model server loads its own BLIP
+RECAPTION_WORKERS = 2
+
+REANALYZE_COLUMNS = ('damage_type', 'image_caption', 'loss_description', 'severity')
+# Only read when recaptioning
+IMAGE_COLUMNS = ('image_hash', 'image_data')
+
+# Set in each worker process by _init_worker
+_worker = {}
+
+
+def _init_worker(recaption, workers):
+    from description_generator import DescriptionGenerator
+
+    _worker['desc_generator'] = DescriptionGenerator(config.DESCRIPTION_RULES or None)
+    _worker['image_store'] = ImageStore(config.IMAGE_STORE_DIR)
+    _worker['captioner'] = None
+    if recaption and config.MODEL_SERVER:
+        from model_server import RemoteCaptioner, socket_paths
+
+        _worker['captioner'] = RemoteCaptioner(socket_paths(), preset=config.CAPTION_PRESET)
+    elif recaption:
+        from image_captioner import create_captioner
+
+        # Split the cores between the workers instead of each using all of them
+        _worker['captioner'] = create_captioner(
+            config.CAPTIONER,
+            quantize=config.CAPTION_QUANTIZE,
+            torchscript=config.CAPTION_TORCHSCRIPT,
+            preset=config.CAPTION_PRESET,
+            num_threads=config.CAPTION_THREADS or max(1, (os.cpu_count() or 1) // workers),
+            stub_delay_ms=config.STUB_CAPTION_DELAY_MS
+        )
+
+
+def _recaption(chunk, batch_size):
+    from ingest import decode_image
+
+    captions = [entry['image_caption'] for entry in chunk]
+
+    def caption_batch(batch):
+        generated = _worker['captioner'].generate_captions([image for _, image in batch])
+        for (index, _), caption in zip(batch, generated):
+            captions[index] = caption
+
+    # Decode one generate call's worth of images at a time, not the whole chunk
+    batch = []
+    for index, entry in enumerate(chunk):
+        try:
+            if entry.get('image_hash'):
+                _, path = _worker['image_store'].find(entry['image_hash'], 'model', None)
+                batch.append((index, decode_image(path)))
+            elif entry.get('image_data'):
+                batch.append((index, decode_image(base64.b64decode(entry['image_data']))))
+        except Exception as e:
+            logger.warning("Keeping caption of entry %s, image unreadable: %s", entry['id'], e)
+        if len(batch) == batch_size:
+            caption_batch(batch)
+            batch = []
+    if batch:
+        caption_batch(batch)
+    return captions
+
+
+def _reanalyze_chunk(args):
+    chunk, batch_size = args
+    if _worker['captioner'] is not None:
+        captions = _recaption(chunk, batch_size)
+    else:
+        captions = [entry['image_caption'] or '' for entry in chunk]
+
+    desc_generator = _worker['desc_generator']
+    assessments = desc_generator.assess_many(captions, [entry['damage_type'] for entry in chunk])
+    updates = []
+    for entry, caption, (description, severity) in zip(chunk, captions, assessments):
+        if (caption, description, severity) != (entry['image_caption'], entry['loss_description'], entry['severity']):
+            updates.append({'id': entry['id'], 'image_caption': caption, 'loss_description': description, 'severity': severity})
+    return chunk[-1]['id'], len(chunk), updates
+
+
+def read_checkpoint(path):
+    try:
+        with open(path, 'r') as f:
+            return int(f.read().strip() or 0)
+    except FileNotFoundError:
+        return 0
+
+
+def write_checkpoint(path, last_id):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(str(last_id))
+    os.replace(tmp_path, path)
+
+
+def reanalyze(history_store, checkpoint_path, workers, chunk_size, recaption, batch_size):
+    after_id = read_checkpoint(checkpoint_path)
+    total = history_store.count()
+    if after_id:
+        print(f"Resuming after entry {after_id}")
+
+    columns = REANALYZE_COLUMNS + IMAGE_COLUMNS if recaption else REANALYZE_COLUMNS
+    chunks = ((chunk, batch_size) for chunk in history_store.iter_chunks(columns, chunk_size, after_id))
+
+    processed = 0
+    changed = 0
+    started = time.monotonic()
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(workers, initializer=_init_worker, initargs=(recaption, workers)) as pool:
+        # At most two chunks per worker are in flight, and results are
+        # written in id order so the checkpoint never skips unfinished work
+        pending = deque()
+        while True:
+            while len(pending) < workers * 2:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                pending.append(pool.apply_async(_reanalyze_chunk, (chunk,)))
+            if not pending:
+                break
+
+            last_id, count, updates = pending.popleft().get()
+            if updates:
+                history_store.update_many(updates)
+            write_checkpoint(checkpoint_path, last_id)
+            processed += count
+            changed += len(updates)
+            elapsed = time.monotonic() - started
+            print(f"{processed}/{total} entries, {changed} updated, {processed / elapsed:.0f} entries/s, last id {last_id}")
+
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    print(f"✅ Re-analysis finished: {processed} entries, {changed} updated")
+
+
+def compact(history_store, image_store, min_age_hours, vacuum):
+    removed = history_store.delete_duplicates()
+    print(f"Removed {removed} duplicate history entries")
+
+    # Blobs younger than min_age may belong to uploads whose job has not
+    # written its history row yet
+    referenced = history_store.image_hashes()
+    cutoff = time.time() - min_age_hours * 3600
+    orphans = 0
+    for image_hash in list(image_store.hashes()):
+        if image_hash not in referenced and image_store.mtime(image_hash) < cutoff:
+            image_store.delete(image_hash)
+            orphans += 1
+    print(f"Removed {orphans} orphaned images")
+
+    if vacuum:
+        history_store.vacuum()
+        print("Vacuumed history database")
+    print("✅ Compaction finished")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    reanalyze_parser = subparsers.add_parser('reanalyze', help='regenerate stored descriptions')
+    reanalyze_parser.add_argument('--recaption', action='store_true', help='also regenerate captions with BLIP')
+    reanalyze_parser.add_argument('--workers', type=int,
+                                  help=f'default: {RECAPTION_WORKERS} with --recaption and no model server, else one per CPU')
+    reanalyze_parser.add_argument('--chunk-size', type=int, default=1000)
+    reanalyze_parser.add_argument('--batch-size', type=int, default=8, help='images per generate call with --recaption')
+    reanalyze_parser.add_argument('--checkpoint', default='data/reanalyze.checkpoint')
+
+    compact_parser = subparsers.add_parser('compact', help='drop duplicate entries and orphaned images')
+    compact_parser.add_argument('--min-age-hours', type=float, default=24)
+    compact_parser.add_argument('--vacuum', action='store_true')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(process)d %(name)s %(levelname)s %(message)s')
+    history_store = create_history_store(config.HISTORY_BACKEND, config.HISTORY_DB)
+
+    if args.command == 'reanalyze':
+        if args.workers is None:
+            args.workers = RECAPTION_WORKERS if args.recaption and not config.MODEL_SERVER else os.cpu_count()
+        reanalyze(history_store, args.checkpoint, args.workers, args.chunk_size, args.recaption, args.batch_size)
+    else:
+        compact(history_store, ImageStore(config.IMAGE_STORE_DIR), args.min_age_hours, args.vacuum)
+
+
+if __name__ == '__main__':
+    main()
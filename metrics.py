@@ -0,0 +1,337 @@
+import cProfile
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import config
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _label_key(labelnames, labels):
+    return tuple(str(labels.get(name, '')) for name in labelnames)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames, key, extra=None):
+    pairs = list(zip(labelnames, key)) + list((extra or {}).items())
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return {'values': [[list(key), value] for key, value in self._values.items()]}
+
+
+class Gauge:
+    """
+    Gauge set directly or, with `callback`, read when metrics are collected.
+    A callback returns a number, or for a one-label gauge a dict mapping
+    label values to numbers.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = value
+
+    def snapshot(self):
+        if self.callback is not None:
+            try:
+                value = self.callback()
+            except Exception as e:
+                logger.warning("Gauge %s callback failed: %s", self.name, e)
+                value = None
+            if isinstance(value, dict):
+                for label_value, number in value.items():
+                    self.set(number, **{self.labelnames[0]: label_value})
+            elif value is not None:
+                self.set(value)
+        with self._lock:
+            return {'values': [[list(key), value] for key, value in self._values.items()]}
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # key -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            state = self._values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def snapshot(self):
+        with self._lock:
+            return {'buckets': list(self.buckets), 'values': [[list(key), list(state)] for key, state in self._values.items()]}
+
+
+class Registry:
+    """
+    Process-local metrics, exportable in the Prometheus text format.
+
+    Web workers and job workers are separate processes, so each one can
+    flush a JSON snapshot to `snapshot_dir`; `render` merges the snapshots
+    of every other process with its own live values. Counters and
+    histograms are summed; gauges keep one series per process (pid label).
+    """
+
+    def __init__(self, snapshot_dir=None):
+        self.snapshot_dir = snapshot_dir
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._flusher = None
+
+    def register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), callback=None):
+        gauge = self.register(Gauge(name, documentation, labelnames, callback))
+        if callback is not None:
+            gauge.callback = callback
+        return gauge
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def snapshot(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {
+            metric.name: dict(metric.snapshot(), kind=metric.kind, help=metric.documentation, labelnames=list(metric.labelnames))
+            for metric in metrics
+        }
+
+    def flush(self):
+        """Write this process's snapshot where other processes' /metrics can merge it"""
+        if not self.snapshot_dir:
+            return
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.snapshot_dir, prefix='.tmp-')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, os.path.join(self.snapshot_dir, f'{os.getpid()}.json'))
+
+    def start_flusher(self, interval=5.0):
+        """Flush snapshots periodically from a daemon thread (once per process)"""
+        if not self.snapshot_dir or (self._flusher is not None and self._flusher.is_alive()):
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.flush()
+                except Exception as e:
+                    logger.warning("Could not flush metrics snapshot: %s", e)
+
+        self._flusher = threading.Thread(target=run, name='metrics-flusher', daemon=True)
+        self._flusher.start()
+
+    def prune(self):
+        """Drop snapshots left by processes that are no longer running"""
+        if not self.snapshot_dir or not os.path.isdir(self.snapshot_dir):
+            return
+        for filename in os.listdir(self.snapshot_dir):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                os.kill(int(filename[:-5]), 0)
+            except ValueError:
+                continue
+            except ProcessLookupError:
+                os.remove(os.path.join(self.snapshot_dir, filename))
+            except PermissionError:
+                pass  # alive, owned by another user
+
+    def _collect(self):
+        self.prune()  # workers come and go; drop their snapshots on every scrape
+        snapshots = [(os.getpid(), self.snapshot())]
+        if self.snapshot_dir and os.path.isdir(self.snapshot_dir):
+            for filename in os.listdir(self.snapshot_dir):
+                if not filename.endswith('.json') or filename == f'{os.getpid()}.json':
+                    continue
+                try:
+                    with open(os.path.join(self.snapshot_dir, filename), 'r') as f:
+                        snapshots.append((filename[:-5], json.load(f)))
+                except (OSError, ValueError):
+                    continue  # being replaced or from an incompatible version
+        return snapshots
+
+    def render(self):
+        merged = {}
+        for pid, snapshot in self._collect():
+            for name, metric in snapshot.items():
+                target = merged.setdefault(name, {
+                    'kind': metric['kind'], 'help': metric['help'], 'labelnames': metric['labelnames'],
+                    'buckets': metric.get('buckets'), 'values': {}
+                })
+                for key, value in metric['values']:
+                    if metric['kind'] == 'gauge':
+                        target['values'][(tuple(key), pid)] = value
+                    elif metric['kind'] == 'counter':
+                        target['values'][tuple(key)] = target['values'].get(tuple(key), 0) + value
+                    else:
+                        current = target['values'].get(tuple(key))
+                        target['values'][tuple(key)] = value if current is None else [a + b for a, b in zip(current, value)]
+
+        lines = []
+        for name in sorted(merged):
+            metric = merged[name]
+            labelnames = metric['labelnames']
+            lines.append(f"# HELP {name} {metric['help']}")
+            lines.append(f"# TYPE {name} {metric['kind']}")
+            for key, value in sorted(metric['values'].items(), key=lambda item: str(item[0])):
+                if metric['kind'] == 'gauge':
+                    key, pid = key
+                    lines.append(f"{name}{_format_labels(labelnames, key, {'pid': pid})} {value}")
+                elif metric['kind'] == 'counter':
+                    lines.append(f"{name}{_format_labels(labelnames, key)} {value}")
+                else:
+                    for bound, count in zip(metric['buckets'], value):
+                        lines.append(f"{name}_bucket{_format_labels(labelnames, key, {'le': bound})} {count}")
+                    lines.append(f"{name}_bucket{_format_labels(labelnames, key, {'le': '+Inf'})} {value[-1]}")
+                    lines.append(f"{name}_sum{_format_labels(labelnames, key)} {value[-2]}")
+                    lines.append(f"{name}_count{_format_labels(labelnames, key)} {value[-1]}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry(config.METRICS_DIR or None)
+
+REQUEST_SECONDS = registry.histogram(
+    'claiminsight_request_seconds', 'HTTP request latency until the response is returned', ('endpoint', 'method', 'status'))
+STAGE_SECONDS = registry.histogram(
+    'claiminsight_stage_seconds', 'Time spent in each processing stage', ('pipeline', 'stage'))
+MODEL_LOAD_SECONDS = registry.gauge(
+    'claiminsight_model_load_seconds', 'Time taken to load the captioning model in this process')
+
+
+def span(pipeline, stage):
+    """Context manager timing one stage of a request or job"""
+    return STAGE_SECONDS.time(pipeline=pipeline, stage=stage)
+
+
+def should_profile():
+    return config.PROFILE_SAMPLE_RATE > 0 and random.random() < config.PROFILE_SAMPLE_RATE
+
+
+def start_profile():
+    """Return an enabled cProfile.Profile for a sampled call, else None"""
+    if not should_profile():
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        return None  # another thread is already being profiled (Python 3.12+)
+    return profiler
+
+
+def dump_profile(profiler, name):
+    os.makedirs(config.PROFILE_DIR, exist_ok=True)
+    path = os.path.join(config.PROFILE_DIR, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.prof")
+    profiler.dump_stats(path)
+    logger.info("Wrote profile %s", path)
+
+
+# One maybe_profile session per process at a time: the torch profiler
+# cannot run concurrent sessions
+_profile_lock = threading.Lock()
+
+
+@contextmanager
+def maybe_profile(name):
+    """
+    Profile a sampled fraction (PROFILE_SAMPLE_RATE) of calls with cProfile,
+    or with the torch profiler (Chrome trace) when PROFILE_TORCH is set.
+    Wrap the code that runs inference; calls made while another session is
+    active are not profiled.
+    """
+    if not should_profile() or not _profile_lock.acquire(blocking=False):
+        yield
+        return
+    try:
+        if config.PROFILE_TORCH:
+            import torch
+
+            with torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU], record_shapes=True) as profiler:
+                yield
+            os.makedirs(config.PROFILE_DIR, exist_ok=True)
+            path = os.path.join(config.PROFILE_DIR, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.trace.json")
+            profiler.export_chrome_trace(path)
+            logger.info("Wrote torch trace %s", path)
+            return
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            yield  # another profiler is active on this thread (Python 3.12+)
+            return
+        try:
+            yield
+        finally:
+            profiler.disable()
+            dump_profile(profiler, name)
+    finally:
+        _profile_lock.release()
@@ -0,0 +1,397 @@
+"""
+Local model server for BLIP captioning.
+
+One or a few dedicated processes each load the captioner once and serve
+captions over a Unix socket; job workers, batch ingestion and re-analysis
+use a RemoteCaptioner instead of loading BLIP themselves. Pixels are not
+pickled through the socket: the client writes them into a shared-memory
+block it owns and sends only its name and the image sizes. Each server
+batches requests from all clients with a CaptionBatcher and can be pinned
+to its own share of the CPUs so the servers do not oversubscribe cores.
+Connections are authenticated with a random key kept in a file only the
+app's user can read, since messages are unpickled by the server.
+
+    MODEL_SERVER=1 gunicorn -c gunicorn.conf.py app:app       # started by the app
+    MODEL_SERVER=1 MODEL_SERVER_START=0 ...; python model_server.py --processes 2
+"""
+import argparse
+import itertools
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from multiprocessing import connection, shared_memory
+
+from PIL import Image
+
+import config
+from presets import DEFAULT_PRESET
+
+
+logger = logging.getLogger(__name__)
+
+# Smallest shared-memory block a client allocates: four 384x384 RGB images
+MIN_BUFFER_SIZE = 4 * 384 * 384 * 3
+
+
+def socket_paths(base=None, processes=None):
+    root, ext = os.path.splitext(base or config.MODEL_SERVER_SOCKET)
+    return [f"{root}-{index}{ext}" for index in range(processes or config.MODEL_SERVER_PROCESSES)]
+
+
+def load_authkey(path=None):
+    """Read the shared connection key, creating it on first use"""
+    path = path or config.MODEL_SERVER_AUTHKEY_FILE
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        pass
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # Written under a temp name and linked into place, so a concurrent
+    # reader never sees a partial key and only one writer wins
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(os.urandom(32))
+    try:
+        os.link(tmp_path, path)
+    except FileExistsError:
+        pass
+    finally:
+        os.remove(tmp_path)
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def cpu_sets(processes):
+    """Split the CPUs this process may use into one disjoint set per server"""
+    if hasattr(os, 'sched_getaffinity'):
+        cpus = sorted(os.sched_getaffinity(0))
+    else:
+        cpus = list(range(os.cpu_count() or 1))
+    share = len(cpus) // processes
+    if share == 0:
+        return [cpus] * processes  # more servers than CPUs: no pinning helps
+    return [cpus[index * share:(index + 1) * share] for index in range(processes)]
+
+
+def _attach(name):
+    """Map a client's shared-memory block without taking ownership of it"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        from multiprocessing import resource_tracker
+
+        shm = shared_memory.SharedMemory(name=name)
+        # Otherwise this process's resource tracker unlinks the client's block on exit
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+class ModelServer:
+    """
+    Serves ('caption', shm_name, sizes, preset) and ('ping',) messages on
+    a Unix socket, one thread per client connection. Images of a request
+    are submitted to the shared batcher individually, so requests from
+    different clients end up in the same generate call.
+    """
+
+    def __init__(self, address, batcher, authkey):
+        self.address = address
+        self.batcher = batcher
+        self.authkey = authkey
+
+    def serve_forever(self):
+        directory = os.path.dirname(self.address)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self.address):
+            os.remove(self.address)  # left behind by a server that did not shut down cleanly
+        # The socket file is created owner-only rather than restricted after bind
+        umask = os.umask(0o177)
+        try:
+            listener = connection.Listener(self.address, 'AF_UNIX', authkey=self.authkey)
+        finally:
+            os.umask(umask)
+        logger.info("Model server listening on %s", self.address)
+        while True:
+            try:
+                conn = listener.accept()
+            except connection.AuthenticationError as e:
+                logger.warning("Rejected model server client: %s", e)
+                continue
+            threading.Thread(target=self._handle, args=(conn,), name='model-server-client', daemon=True).start()
+
+    def _read_images(self, shm, sizes):
+        images = []
+        offset = 0
+        for width, height in sizes:
+            length = width * height * 3
+            # One copy out of the mapping, so it can be released before batching
+            with shm.buf[offset:offset + length] as view:
+                images.append(Image.frombytes('RGB', (width, height), view))
+            offset += length
+        return images
+
+    def _handle(self, conn):
+        shm = None
+        try:
+            while True:
+                try:
+                    message = conn.recv()
+                except EOFError:
+                    return
+                if message[0] == 'ping':
+                    conn.send(('ok', None))
+                    continue
+
+                _, shm_name, sizes, preset = message
+                try:
+                    if shm is None or shm.name != shm_name:
+                        if shm is not None:
+                            shm.close()
+                        shm = _attach(shm_name)
+                    futures = [self.batcher.submit(image, preset) for image in self._read_images(shm, sizes)]
+                    conn.send(('ok', [future.result() for future in futures]))
+                except Exception as e:
+                    conn.send(('error', str(e)))
+        finally:
+            conn.close()
+            if shm is not None:
+                shm.close()
+
+
+def serve(address, authkey, cpus=None):
+    """Load the captioner and serve it on `address`; runs in a server process"""
+    from caption_batcher import CaptionBatcher
+    from image_captioner import create_captioner
+    from metrics import MODEL_LOAD_SECONDS, registry
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(process)d %(name)s %(levelname)s %(message)s')
+    num_threads = config.CAPTION_THREADS or None
+    if cpus and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+        num_threads = num_threads or len(cpus)
+        logger.info("Pinned model server to CPUs %s", cpus)
+
+    captioner = create_captioner(
+        config.CAPTIONER,
+        quantize=config.CAPTION_QUANTIZE,
+        torchscript=config.CAPTION_TORCHSCRIPT,
+        preset=config.CAPTION_PRESET,
+        num_threads=num_threads,
+        stub_delay_ms=config.STUB_CAPTION_DELAY_MS
+    )
+    if config.MODEL_WARMUP:
+        captioner.warm_up()
+    MODEL_LOAD_SECONDS.set(captioner.load_seconds)
+    registry.start_flusher()
+
+    batcher = CaptionBatcher(captioner, config.CAPTION_BATCH_SIZE, config.CAPTION_BATCH_WAIT_MS)
+    ModelServer(address, batcher, authkey).serve_forever()
+
+
+class ModelServerPool:
+    """
+    One server process per address, spawned by `start`. A supervisor
+    thread in the starting process respawns servers that died, e.g. when
+    the kernel killed one for memory; clients reconnect on their next
+    request once the new server has loaded its model.
+    """
+
+    def __init__(self, addresses=None, pin_cpus=None, supervise_interval=5):
+        self.addresses = addresses or socket_paths()
+        pin_cpus = config.MODEL_SERVER_PIN_CPUS if pin_cpus is None else pin_cpus
+        self.cpus = cpu_sets(len(self.addresses)) if pin_cpus else [None] * len(self.addresses)
+        self.supervise_interval = supervise_interval
+        self._context = multiprocessing.get_context('spawn')
+        self._processes = []
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        # gunicorn may fork a web worker while the supervisor holds the lock
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset_lock)
+
+    def _reset_lock(self):
+        self._lock = threading.Lock()
+
+    def _spawn(self, index):
+        process = self._context.Process(
+            target=serve,
+            args=(self.addresses[index], load_authkey(), self.cpus[index]),
+            name=f'model-server-{index}',
+            daemon=True
+        )
+        process.start()
+        return process
+
+    def start(self):
+        with self._lock:
+            if self._processes:
+                return
+            self._processes = [self._spawn(index) for index in range(len(self.addresses))]
+            self._stopping.clear()
+            threading.Thread(target=self._supervise, name='model-server-supervisor', daemon=True).start()
+
+    def _supervise(self):
+        while not self._stopping.wait(self.supervise_interval):
+            try:
+                self._respawn_dead_servers()
+            except Exception:
+                logger.exception("Model server supervisor check failed")
+
+    def _respawn_dead_servers(self):
+        with self._lock:
+            if self._stopping.is_set():
+                return
+            for index, process in enumerate(self._processes):
+                if process.is_alive():
+                    continue
+                logger.warning("Model server %s (pid %s) exited with code %s, respawning",
+                               process.name, process.pid, process.exitcode)
+                self._processes[index] = self._spawn(index)
+
+    def join(self):
+        """Block until `stop` is called from another thread or a signal handler"""
+        self._stopping.wait()
+
+    def stop(self):
+        self._stopping.set()
+        with self._lock:
+            for process in self._processes:
+                process.terminate()
+            for process in self._processes:
+                process.join(timeout=10)
+            self._processes = []
+
+
+class _Channel:
+    """One client connection plus the shared-memory block it sends pixels through"""
+
+    def __init__(self, address, authkey):
+        self.pid = os.getpid()
+        self.conn = connection.Client(address, 'AF_UNIX', authkey=authkey)
+        self.shm = None
+
+    def buffer(self, size):
+        if self.shm is None or self.shm.size < size:
+            self.release_buffer()
+            self.shm = shared_memory.SharedMemory(create=True, size=max(size, MIN_BUFFER_SIZE))
+        return self.shm
+
+    def release_buffer(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def close(self):
+        self.conn.close()
+        self.release_buffer()
+
+
+class RemoteCaptioner:
+    """
+    Captioner interface backed by model server processes.
+
+    Each thread keeps its own connection, spread round-robin over the
+    servers, so no model is loaded in the calling process.
+    """
+
+    def __init__(self, addresses, preset=DEFAULT_PRESET, ready_timeout=600, authkey=None):
+        self.addresses = list(addresses)
+        self.preset = preset
+        self.authkey = authkey or load_authkey()
+        self.ready_timeout = ready_timeout
+        self.load_seconds = 0.0
+        self._local = threading.local()
+        self._next = itertools.count()
+
+    def _channel(self):
+        channel = getattr(self._local, 'channel', None)
+        # Connections and buffers of a parent process are not reused after a fork
+        if channel is None or channel.pid != os.getpid():
+            channel = _Channel(self.addresses[next(self._next) % len(self.addresses)], self.authkey)
+            self._local.channel = channel
+        return channel
+
+    def _request(self, build_message):
+        """Send a message built for the current channel, reconnecting once if the server went away"""
+        for attempt in range(2):
+            channel = self._channel()
+            try:
+                channel.conn.send(build_message(channel))
+                status, value = channel.conn.recv()
+                break
+            except (EOFError, OSError):
+                channel.close()
+                self._local.channel = None
+                if attempt:
+                    raise
+        if status != 'ok':
+            raise RuntimeError(f"Model server error: {value}")
+        return value
+
+    def warm_up(self):
+        """Wait until every model server has loaded its model and answers"""
+        deadline = time.monotonic() + self.ready_timeout
+        for address in self.addresses:
+            while True:
+                try:
+                    conn = connection.Client(address, 'AF_UNIX', authkey=self.authkey)
+                    conn.send(('ping',))
+                    conn.recv()
+                    conn.close()
+                    break
+                except (FileNotFoundError, ConnectionRefusedError, EOFError):
+                    if time.monotonic() > deadline:
+                        raise TimeoutError(f"Model server {address} not ready after {self.ready_timeout}s")
+                    time.sleep(0.5)
+
+    def generate_caption(self, image_path):
+        try:
+            if not os.path.exists(image_path):
+                return "Error: Image file not found"
+            return self.generate_captions([Image.open(image_path).convert('RGB')])[0]
+        except Exception as e:
+            return f"Error in caption generation: {str(e)}"
+
+    def generate_captions(self, images, preset=None):
+        images = [image if image.mode == 'RGB' else image.convert('RGB') for image in images]
+        sizes = [image.size for image in images]
+
+        def message(channel):
+            shm = channel.buffer(sum(width * height * 3 for width, height in sizes))
+            offset = 0
+            for image in images:
+                data = image.tobytes()
+                shm.buf[offset:offset + len(data)] = data
+                offset += len(data)
+            return ('caption', shm.name, sizes, preset or self.preset)
+
+        return self._request(message)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processes', type=int, default=config.MODEL_SERVER_PROCESSES)
+    parser.add_argument('--socket', default=config.MODEL_SERVER_SOCKET, help='socket path; server i appends -i')
+    parser.add_argument('--no-pin', action='store_true', help='do not pin servers to CPU sets')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(process)d %(name)s %(levelname)s %(message)s')
+    pool = ModelServerPool(socket_paths(args.socket, args.processes), pin_cpus=not args.no_pin,
+                           supervise_interval=config.MODEL_SERVER_SUPERVISE_INTERVAL)
+    pool.start()
+    try:
+        pool.join()
+    except KeyboardInterrupt:
+        pool.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,65 +1,208 @@
-class DescriptionGenerator:
-    def __init__(self):
-        print("✅ Description generator initialized!")
+import base64
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from io import BytesIO
+from textwrap import wrap
 
-    def enhance_description(self, image_caption, damage_type):
+from PIL import Image
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+
+
+logger = logging.getLogger(__name__)
+
+BRAND_BLUE = (0/255, 119/255, 182/255)
+PAGE_WIDTH, PAGE_HEIGHT = A4
+
+IMAGE_MAX_WIDTH = 300
+IMAGE_MAX_HEIGHT = 200
+# Images are embedded at twice their drawn size so they stay sharp in print
+IMAGE_EMBED_SCALE = 2
+# Images without a stored 'pdf' variant are re-encoded once at this quality
+IMAGE_EMBED_QUALITY = 85
+
+TEXT_WRAP_WIDTH = 90  # characters per line
+BOTTOM_MARGIN = 100
+
+
+class ReportEngine:
+    """
+    Builds loss description PDFs for one or many claims.
+
+    The header band and footer are drawn once per document as reportlab
+    forms and referenced from every page. Images are read from the image
+    store by hash, downscaled to their embed size and cached, so repeated
+    photos across a history range are decoded once. Pages are compressed,
+    but reportlab keeps every page until `save`, so a report is complete
+    before its first byte can be sent; `spool` writes it to a temp file
+    instead of memory.
+    """
+
+    def __init__(self, image_store, image_cache_size=64):
+        self.image_store = image_store
+        self.image_cache_size = image_cache_size
+        self._images = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _define_forms(self, p, generated_on):
+        p.beginForm('report_header')
+        p.setFillColorRGB(*BRAND_BLUE)
+        p.rect(0, PAGE_HEIGHT-100, PAGE_WIDTH, 100, fill=1)
+        p.setFillColorRGB(1, 1, 1)
+        p.setFont("Helvetica-Bold", 20)
+        p.drawString(50, PAGE_HEIGHT-60, "Insurance Loss Description Report")
+        p.setFont("Helvetica", 12)
+        p.drawString(50, PAGE_HEIGHT-80, "Generated by ClaimInsight AI System")
+        p.endForm()
+
+        p.beginForm('page_footer')
+        p.setFillColorRGB(0, 0, 0)
+        p.setFont("Helvetica", 8)
+        p.drawString(50, 30, "Confidential - For Insurance Claim Purposes")
+        p.drawString(400, 30, f"Generated on: {generated_on.strftime('%d %b %Y')}")
+        p.endForm()
+
+    def _image(self, claim):
+        """
+        Return (ImageReader, width, height) for a claim's image, or None.
+        Readers wrap JPEG bytes, which reportlab embeds as they are; a
+        decoded PIL image would be embedded as raw RGB, about ten times
+        larger, and held until the report is saved.
+        """
+        image_hash = claim.get('image_hash')
+        key = image_hash or claim.get('image_data')
+        if not key:
+            return None
+        with self._lock:
+            if key in self._images:
+                self._images.move_to_end(key)
+                return self._images[key]
+
+        variant = None
+        if image_hash:
+            variant, _ = self.image_store.find(image_hash, 'pdf', None)
+            data = self.image_store.get(image_hash, variant)
+        else:
+            data = base64.b64decode(claim['image_data'])
+        if variant != 'pdf':
+            # Originals and legacy base64 images: downscale and re-encode once
+            with Image.open(BytesIO(data)) as img:
+                img.draft('RGB', (IMAGE_MAX_WIDTH * IMAGE_EMBED_SCALE, IMAGE_MAX_HEIGHT * IMAGE_EMBED_SCALE))
+                img = img.convert('RGB')
+            img.thumbnail((IMAGE_MAX_WIDTH * IMAGE_EMBED_SCALE, IMAGE_MAX_HEIGHT * IMAGE_EMBED_SCALE))
+            buffer = BytesIO()
+            img.save(buffer, 'JPEG', quality=IMAGE_EMBED_QUALITY)
+            data = buffer.getvalue()
+        reader = ImageReader(BytesIO(data))
+
+        img_width, img_height = reader.getSize()
+        aspect = img_width / img_height
+        if aspect > IMAGE_MAX_WIDTH/IMAGE_MAX_HEIGHT:
+            draw_width = IMAGE_MAX_WIDTH
+            draw_height = draw_width / aspect
+        else:
+            draw_height = IMAGE_MAX_HEIGHT
+            draw_width = draw_height * aspect
+
+        entry = (reader, draw_width, draw_height)
+        with self._lock:
+            self._images[key] = entry
+            while len(self._images) > self.image_cache_size:
+                self._images.popitem(last=False)
+        return entry
+
+    def _new_page(self, p):
+        p.showPage()
+        p.doForm('page_footer')
+        return PAGE_HEIGHT - 50
+
+    def _draw_claim(self, p, claim, generated_on):
+        p.doForm('report_header')
+        p.doForm('page_footer')
+
+        # Damage Info
+        y = PAGE_HEIGHT - 130
+        p.setFillColorRGB(*BRAND_BLUE)
+        p.setFont("Helvetica-Bold", 14)
+        p.drawString(50, y, "Damage Assessment Details")
+        p.setFillColorRGB(0, 0, 0)
+        y -= 20
+        p.setFont("Helvetica", 12)
+        p.drawString(50, y, f"Damage Type: {claim.get('damage_type', '')}")
+        if claim.get('date'):
+            y -= 20
+            p.drawString(50, y, f"Assessment Date: {claim['date']}")
+        y -= 20
+        p.drawString(50, y, f"Report Date: {generated_on.strftime('%Y-%m-%d %H:%M:%S')}")
+
+        # Loss Description
+        y -= 40
+        p.setFillColorRGB(*BRAND_BLUE)
+        p.setFont("Helvetica-Bold", 14)
+        p.drawString(50, y, "Professional Loss Description")
+        y -= 20
+        p.setFillColorRGB(0, 0, 0)
+
+        for paragraph in (claim.get('loss_description') or '').split('\n'):
+            for line in wrap(paragraph, width=TEXT_WRAP_WIDTH):
+                if line.strip():
+                    if y < BOTTOM_MARGIN:
+                        y = self._new_page(p)
+                    p.setFont("Helvetica", 10)
+                    p.drawString(50, y, line.strip())
+                    y -= 15
+
+        # Damage Image, moved to a new page when it does not fit
         try:
-            severity = self.assess_severity(image_caption)
-            description = self.create_professional_description(image_caption, damage_type, severity)
-            return description
+            image = self._image(claim)
         except Exception as e:
-            print(f"[Error in enhance_description]: {e}")
-            return f"Professional assessment confirms {damage_type}. {image_caption} Recommended: Detailed inspection by certified appraiser."
-
-    def assess_severity(self, caption):
-        caption_lower = caption.lower()
-        severe_keywords = ['severe', 'major', 'extensive', 'destroyed', 'broken', 'smashed', 'wrecked', 'totaled']
-        moderate_keywords = ['moderate', 'multiple', 'several', 'significant', 'damaged', 'dents', 'cracks']
-        minor_keywords = ['minor', 'small', 'slight', 'light', 'few', 'scratch', 'scratches']
-
-        if any(keyword in caption_lower for keyword in severe_keywords):
-            return "severe"
-        elif any(keyword in caption_lower for keyword in moderate_keywords):
-            return "moderate"
-        elif any(keyword in caption_lower for keyword in minor_keywords):
-            return "minor"
-        else:
-            return "moderate"
-
-    def create_professional_description(self, caption, damage_type, severity):
-        severity_phrases = {
-            "severe": "**SEVERE DAMAGE ASSESSMENT**: The inspection indicates extensive and critical damage affecting multiple structural or functional areas of the property. Immediate mitigation and safety measures are required.",
-            "moderate": "**MODERATE DAMAGE ASSESSMENT**: The inspection reveals notable damage that, while not catastrophic, demands professional repair and restoration. The extent of impairment may affect operational or residential usability until repairs are completed.",
-            "minor": "**MINOR DAMAGE ASSESSMENT**: The inspection identifies superficial or localized damage with limited functional impact. Repairs can be addressed through routine maintenance and corrective procedures."
-        }
-
-        damage_specific = {
-            "fire damage": f"Fire and smoke exposure have resulted in surface deterioration, soot accumulation, and thermal distress to key components. {caption}",
-            "water damage": f"Prolonged moisture exposure has caused visible staining, swelling, or structural weakening in affected areas. {caption}",
-            "hail damage": f"Impact marks and granule displacement from hail are visible across exposed surfaces. {caption}",
-            "flood damage": f"Water intrusion has affected ground-level materials and electrical systems, requiring professional dehumidification and restoration. {caption}",
-            "collision damage": f"Impact deformation and surface fracturing indicate substantial mechanical stress to the affected structure. {caption}",
-            "vandalism": f"Intentional surface defacement and structural tampering are evident. {caption}",
-            "storm damage": f"Wind, debris, and precipitation exposure have compromised external integrity and finish. {caption}",
-            "theft": f"Signs of forced entry and material removal are observed, suggesting deliberate tampering. {caption}"
-        }
-
-        base_description = damage_specific.get(
-            damage_type.lower(),
-            f"Observed damage corresponds with {damage_type.lower()} conditions. {caption}"
-        )
-
-        recommendations = {
-            "severe": "**RECOMMENDATION**: Immediate intervention by certified restoration professionals is required. Full structural safety evaluation and phased reconstruction are strongly advised.",
-            "moderate": "**RECOMMENDATION**: Professional repair assessment, material replacement, and post-restoration verification are recommended to restore functional and visual integrity.",
-            "minor": "**RECOMMENDATION**: Routine maintenance and targeted repair should be scheduled to prevent progressive deterioration."
-        }
-
-        recommendation = recommendations.get(
-            severity,
-            "**RECOMMENDATION**: Further professional evaluation is advised to determine corrective actions."
-        )
-
-        full_text = f"{severity_phrases[severity]} {base_description} {recommendation}"
-        full_text = full_text.encode("ascii", "ignore").decode()
-        return full_text
+            logger.warning("Error adding image to PDF: %s", e)
+            image = None
+        if image is not None:
+            reader, img_width, img_height = image
+            if y - 50 - img_height < BOTTOM_MARGIN:
+                y = self._new_page(p)
+            y -= 30
+            p.setFillColorRGB(*BRAND_BLUE)
+            p.setFont("Helvetica-Bold", 14)
+            p.drawString(50, y, "Damage Image")
+            y -= 20
+            p.drawImage(reader, 50, y-img_height, width=img_width, height=img_height)
+
+        p.showPage()
+
+    def write(self, claims, output):
+        """Render every claim in the `claims` iterable, one or more pages each, into `output`"""
+        generated_on = datetime.now()
+        p = canvas.Canvas(output, pagesize=A4, pageCompression=1)
+        self._define_forms(p, generated_on)
+        drawn = 0
+        for claim in claims:
+            self._draw_claim(p, claim, generated_on)
+            drawn += 1
+        if not drawn:
+            p.doForm('report_header')
+            p.doForm('page_footer')
+            p.setFont("Helvetica", 12)
+            p.drawString(50, PAGE_HEIGHT-130, "No assessments match this report.")
+        p.save()
+
+    def render(self, claims):
+        buffer = BytesIO()
+        self.write(claims, buffer)
+        return buffer.getvalue()
+
+    def spool(self, claims):
+        """Render into a rewound temp file that moves to disk above a few MB; the caller closes it"""
+        output = tempfile.SpooledTemporaryFile(max_size=4 * 1024 * 1024)
+        try:
+            self.write(claims, output)
+        except Exception:
+            output.close()
+            raise
+        output.seek(0)
+        return output
@@ -0,0 +1,158 @@
+from datetime import datetime
+
+import config
+from caption_batcher import CaptionBatcher
+from caption_cache import CaptionCache, dhash
+from description_generator import DescriptionGenerator
+from history_store import create_history_store
+from image_store import ImageStore
+from ingest import decode_image, ingest_staged
+from metrics import MODEL_LOAD_SECONDS, registry, span
+
+
+# Stores are cheap to open and safe to share between threads; each process
+# (web worker or job worker) gets its own instances on import.
+image_store = ImageStore(config.IMAGE_STORE_DIR)
+history_store = create_history_store(config.HISTORY_BACKEND, config.HISTORY_DB)
+caption_cache = CaptionCache(config.CAPTION_CACHE_SIZE, config.CAPTION_CACHE_HAMMING, config.CAPTION_CACHE_DB or None)
+
+# Initialize models (cached)
+captioner = None
+desc_generator = None
+caption_batcher = None
+
+
+def load_models():
+    """Load model weights only; safe to call before forking workers"""
+    global captioner, desc_generator
+    if captioner is None or desc_generator is None:
+        if config.MODEL_SERVER:
+            # torch is never imported here; the model lives in the servers
+            from model_server import RemoteCaptioner, socket_paths
+
+            captioner = RemoteCaptioner(socket_paths(), preset=config.CAPTION_PRESET)
+        else:
+            from image_captioner import create_captioner
+
+            captioner = create_captioner(
+                config.CAPTIONER,
+                quantize=config.CAPTION_QUANTIZE,
+                torchscript=config.CAPTION_TORCHSCRIPT,
+                preset=config.CAPTION_PRESET,
+                num_threads=config.CAPTION_THREADS or None,
+                stub_delay_ms=config.STUB_CAPTION_DELAY_MS
+            )
+        desc_generator = DescriptionGenerator(config.DESCRIPTION_RULES or None)
+        MODEL_LOAD_SECONDS.set(captioner.load_seconds)
+    return captioner, desc_generator
+
+
+def get_models():
+    """Initialize models only when needed"""
+    global caption_batcher
+    load_models()
+    # The batcher thread does not survive a fork, so each process starts its own
+    if caption_batcher is None or not caption_batcher.is_alive():
+        caption_batcher = CaptionBatcher(captioner, config.CAPTION_BATCH_SIZE, config.CAPTION_BATCH_WAIT_MS)
+    return captioner, desc_generator
+
+
+def _batcher_stat(name):
+    return caption_batcher.stats()[name] if caption_batcher is not None else 0
+
+
+def _cache_lookups():
+    stats = caption_cache.stats()
+    return {
+        'exact': stats['exact_hits'],
+        'perceptual': stats['perceptual_hits'],
+        'disk': stats['disk_hits'],
+        'miss': stats['misses']
+    }
+
+
+registry.gauge('claiminsight_batcher_queue_depth', 'Images waiting for the caption batcher',
+               callback=lambda: _batcher_stat('queue_depth'))
+registry.gauge('claiminsight_batcher_mean_batch_size', 'Mean images per caption generate call',
+               callback=lambda: _batcher_stat('mean_batch_size'))
+registry.gauge('claiminsight_caption_cache_lookups', 'Caption cache lookups by result', ('result',),
+               callback=_cache_lookups)
+registry.gauge('claiminsight_caption_cache_hit_rate', 'Fraction of caption cache lookups that hit',
+               callback=lambda: caption_cache.stats()['hit_rate'])
+
+
+def caption_image(image_hash, preset=None, image=None):
+    """
+    Caption a stored image, reusing cached captions of identical or
+    near-identical photos; misses go through the shared batcher.
+    A cached caption is reused only for its own preset or a cheaper one.
+    Errors propagate, so the job fails instead of storing an error string.
+    `image` is the model input when the caller has just decoded it;
+    otherwise the stored variant is decoded.
+    """
+    preset = preset or config.CAPTION_PRESET
+    if image is None:
+        with span('job', 'decode'):
+            # Uploads from before ingest variants only have the original
+            _, path = image_store.find(image_hash, 'model', None)
+            image = decode_image(path)
+    with span('job', 'cache_lookup'):
+        perceptual_hash = dhash(image)
+        caption = caption_cache.get(image_hash, perceptual_hash, preset)
+    if caption is None:
+        get_models()
+        with span('job', 'caption'):
+            caption = caption_batcher.caption(image, preset)
+        caption_cache.put(image_hash, perceptual_hash, caption, preset)
+    return caption
+
+
+def add_to_history(entry):
+    history_store.add(entry)
+
+
+def process_upload(image_hash, damage_type, filename, preset=None, archive_original=False, on_stage=None):
+    """
+    Run the ingest -> caption -> description -> persist stages for a
+    staged upload and return the result shown to the client
+    """
+    def stage(name):
+        if on_stage is not None:
+            on_stage(name)
+
+    stage('ingest')
+    with span('job', 'ingest'):
+        _, model_image = ingest_staged(image_store, image_hash, archive_original)
+
+    stage('caption')
+    captioner, desc_generator = get_models()
+    image_caption = caption_image(image_hash, preset, model_image)
+
+    stage('describe')
+    with span('job', 'describe'):
+        loss_description, severity = desc_generator.assess(image_caption, damage_type)
+
+    stage('persist')
+    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    with span('job', 'history_write'):
+        add_to_history({
+            'date': timestamp,
+            'damage_type': damage_type,
+            'image_caption': image_caption,
+            'loss_description': loss_description,
+            'image_hash': image_hash,
+            'severity': severity
+        })
+
+    return {
+        'success': True,
+        'image_caption': image_caption,
+        'damage_type': damage_type,
+        'loss_description': loss_description,
+        'severity': severity,
+        'timestamp': timestamp,
+        'filename': filename,
+        'image_hash': image_hash,
+        'image_url': f"/images/{image_hash}",
+        'thumbnail_url': f"/images/{image_hash}?variant=thumb"
+    }
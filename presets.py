@@ -0,0 +1,10 @@
+# Named decoding settings; beam search costs several times more than greedy on CPU.
+# Kept free of torch imports so web workers can validate presets without loading it.
+DECODING_PRESETS = {
+    'fast': {'max_length': 30, 'num_beams': 1, 'do_sample': False},
+    'balanced': {'max_length': 40, 'num_beams': 3, 'early_stopping': True},
+    'quality': {'max_length': 50, 'num_beams': 5, 'early_stopping': True},
+}
+DEFAULT_PRESET = 'quality'
+# Presets from cheapest to best; a caption can stand in for any preset ranked at or below its own
+PRESET_RANK = {name: rank for rank, name in enumerate(DECODING_PRESETS)}
@@ -121,18 +121,48 @@ async function processImage() {
         const data = await response.json();
         
         if (data.success) {
-            displayResults(data);
+            const result = await waitForJob(data.status_url);
+            displayResults(result);
         } else {
             showError(data.error || 'An error occurred while processing the image.');
         }
     } catch (error) {
-        showError('Network error: ' + error.message);
+        showError(error.message);
     } finally {
         hideLoading();
         generateBtn.disabled = false;
     }
 }
 
+// Follow a queued upload job until it finishes by polling its status
+// URL, backing off so a long job costs a handful of short requests
+const JOB_POLL_MIN_MS = 500;
+const JOB_POLL_MAX_MS = 5000;
+
+async function waitForJob(statusUrl) {
+    let delay = JOB_POLL_MIN_MS;
+    while (true) {
+        await new Promise(resolve => setTimeout(resolve, delay));
+        let response;
+        try {
+            response = await fetch(statusUrl, { cache: 'no-store' });
+        } catch (error) {
+            throw new Error('Network error: lost connection while processing the image.');
+        }
+        const job = await response.json();
+        if (!response.ok) {
+            throw new Error(job.error || 'An error occurred while processing the image.');
+        }
+        if (job.status === 'done') {
+            return job.result;
+        }
+        if (job.status === 'failed') {
+            throw new Error(job.error || 'An error occurred while processing the image.');
+        }
+        delay = Math.min(delay * 1.5, JOB_POLL_MAX_MS);
+    }
+}
+
 function displayResults(data) {
     imageCaption.textContent = data.image_caption;
     lossDescription.textContent = data.loss_description;
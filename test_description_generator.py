@@ -0,0 +1,33 @@
+import pytest
+
+from description_generator import DescriptionGenerator
+
+
+@pytest.fixture(scope='module')
+def generator():
+    return DescriptionGenerator()
+
+
+@pytest.mark.parametrize('caption, severity', [
+    ('a severely damaged car', 'severe'),
+    ('a scratched door', 'minor'),
+    ('a lightly damaged roof', 'minor'),
+    ('a damaged car', 'moderate'),
+    ('a car with broken headlights and scratches', 'severe'),
+    ('severe damage and a slightly scratched door', 'severe'),
+])
+def test_assess_severity_inflected_keywords(generator, caption, severity):
+    assert generator.assess_severity(caption) == severity
+
+
+def test_assess_severity_ignores_keywords_inside_words(generator):
+    assert generator.assess_severity('a plane in flight over a house') == 'moderate'
+
+
+def test_assess_many_matches_assess(generator):
+    captions = ['a scratched door', 'a severely damaged car', 'a scratched door']
+    damage_types = ['Hail Damage', 'Collision Damage', 'Vandalism']
+    assert generator.assess_many(captions, damage_types) == [
+        generator.assess(caption, damage_type) for caption, damage_type in zip(captions, damage_types)
+    ]
+    assert generator.assess_many(captions, 'Hail Damage')[2] == generator.assess('a scratched door', 'Hail Damage')
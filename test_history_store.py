@@ -0,0 +1,173 @@
+import json
+
+import pytest
+
+from history_store import HistoryStore, SQLiteHistoryStore, migrate_json_history
+
+
+def make_entry(index, damage_type='Hail Damage', severity='minor', caption='a scratched door'):
+    return {
+        'date': f'2025-01-{index % 28 + 1:02d} 12:00:00',
+        'damage_type': damage_type,
+        'image_caption': caption,
+        'loss_description': f'Entry {index}',
+        'severity': severity
+    }
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SQLiteHistoryStore(str(tmp_path / 'history.db'))
+    yield store
+    store.close()
+
+
+def stored_facets(store):
+    conn = store._connect()
+    return {
+        (row[0], row[1]): row[2]
+        for row in conn.execute(
+            'SELECT damage_type, severity, SUM(entries) FROM history_facets GROUP BY 1, 2 HAVING SUM(entries) > 0'
+        )
+    }
+
+
+def test_history_store_is_abstract():
+    with pytest.raises(TypeError):
+        HistoryStore()
+
+
+def test_schema_migration_is_idempotent(tmp_path):
+    path = str(tmp_path / 'history.db')
+    first = SQLiteHistoryStore(path)
+    first.add(make_entry(1))
+    first.close()
+
+    second = SQLiteHistoryStore(path)
+    assert second.count() == 1
+    assert stored_facets(second) == {('Hail Damage', 'minor'): 1}
+    assert [entry['date'] for entry in second.search('scratched')['entries']] == ['2025-01-02 12:00:00']
+    second.close()
+
+
+def test_migrate_json_history_imports_once(tmp_path, store):
+    json_path = tmp_path / 'detection_history.json'
+    json_path.write_text(json.dumps([make_entry(index) for index in range(3)]))
+
+    assert migrate_json_history(str(json_path), store) == 3
+    assert not json_path.exists()
+    assert (tmp_path / 'detection_history.json.migrated').exists()
+
+    # A copy restored to the same path is the same source and is not imported again
+    json_path.write_text(json.dumps([make_entry(index) for index in range(3)]))
+    assert migrate_json_history(str(json_path), store) == 0
+    assert store.count() == 3
+
+
+def test_migrate_json_history_keeps_unreadable_file(tmp_path, store):
+    json_path = tmp_path / 'detection_history.json'
+    json_path.write_text('[{"date": ')
+
+    assert migrate_json_history(str(json_path), store) == 0
+    assert json_path.exists()
+    assert store.count() == 0
+
+
+def test_page_walks_history_by_keyset(store):
+    store.add_many([make_entry(index) for index in range(7)])
+
+    seen = []
+    before_id = None
+    while True:
+        page = store.page(('date', 'loss_description'), 3, before_id=before_id)
+        entries = list(page)
+        seen += [entry['loss_description'] for entry in entries]
+        if not page.has_more:
+            break
+        before_id = page.next_cursor
+        assert before_id == entries[-1]['id']
+
+    assert seen == [f'Entry {index}' for index in reversed(range(7))]
+
+
+def test_page_filters_by_damage_type(store):
+    store.add_many([make_entry(index, damage_type='Hail Damage' if index % 2 else 'Fire Damage') for index in range(6)])
+
+    page = store.page(('damage_type',), 10, damage_type='Fire Damage')
+    assert [entry['damage_type'] for entry in page] == ['Fire Damage'] * 3
+    assert not page.has_more
+
+
+def test_facets_follow_updates_and_deletes(store):
+    store.add_many([make_entry(0), make_entry(1), make_entry(2, damage_type='Fire Damage', severity='severe')])
+    ids = [entry['id'] for entry in store.all()]
+
+    store.update_many([{'id': ids[0], 'damage_type': 'Water Damage', 'severity': 'moderate'}])
+    assert stored_facets(store) == {
+        ('Hail Damage', 'minor'): 1,
+        ('Water Damage', 'moderate'): 1,
+        ('Fire Damage', 'severe'): 1
+    }
+
+    store._connect().execute('DELETE FROM history WHERE id = ?', (ids[2],))
+    assert stored_facets(store) == {('Hail Damage', 'minor'): 1, ('Water Damage', 'moderate'): 1}
+    assert store.damage_types() == ['Hail Damage', 'Water Damage']
+
+    result = store.search()
+    assert result['total'] == 2
+    assert result['facets']['severity'] == {'minor': 1, 'moderate': 1}
+
+
+def test_delete_duplicates_updates_facets(store):
+    store.add_many([make_entry(1), make_entry(1), make_entry(2)])
+
+    assert store.delete_duplicates() == 1
+    assert stored_facets(store) == {('Hail Damage', 'minor'): 2}
+
+
+def test_search_ranks_text_matches(store):
+    store.add_many([
+        make_entry(0, caption='a roof with missing shingles'),
+        make_entry(1, caption='a car with a broken window'),
+        dict(make_entry(2, caption='a damaged car'), loss_description='The window was broken by hail'),
+        make_entry(3, caption='a broken fence', damage_type='Vandalism', severity='moderate'),
+    ])
+
+    result = store.search('broken window')
+    # Caption terms weigh more than description terms
+    assert [entry['image_caption'] for entry in result['entries']] == ['a car with a broken window', 'a damaged car']
+    assert result['total'] == 2
+    assert result['facets']['damage_type'] == {'Hail Damage': 2}
+    assert not result['facets_capped']
+
+    assert store.search('broke*')['total'] == 3
+    assert store.search('broken', damage_type='Vandalism')['entries'][0]['image_caption'] == 'a broken fence'
+
+
+def test_search_follows_caption_updates(store):
+    store.add(make_entry(0, caption='a scratched door'))
+    entry_id = store.all()[0]['id']
+
+    store.update_many([{'id': entry_id, 'image_caption': 'a flooded basement'}])
+    assert store.search('scratched')['total'] == 0
+    assert store.search('flooded')['total'] == 1
+
+
+def test_search_pages_text_matches_by_offset(store):
+    store.add_many([make_entry(index, caption=f'a broken window {index}') for index in range(5)])
+
+    first = store.search('broken', limit=3)
+    second = store.search('broken', limit=3, cursor=first['next_cursor'])
+    assert first['next_cursor'] == 3
+    assert second['next_cursor'] is None
+    ids = [entry['id'] for entry in first['entries'] + second['entries']]
+    assert sorted(ids) == sorted(entry['id'] for entry in store.all())
+
+
+def test_search_without_facets(store):
+    store.add(make_entry(0, caption='a broken window'))
+
+    result = store.search('broken', facets=False)
+    assert len(result['entries']) == 1
+    assert result['total'] is None
+    assert result['facets'] is None
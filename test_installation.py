@@ -4,7 +4,9 @@ try:
     import torch
     import torchvision
     from transformers import BlipProcessor, BlipForConditionalGeneration
-    import streamlit as st
+    import flask
+    import gunicorn
+    import reportlab
     from PIL import Image
     import numpy as np
     
@@ -13,4 +15,4 @@ try:
     print("✅ Installation completed successfully!")
     
 except Exception as e:
-    print(f"❌ Error: {e}")
\ No newline at end of file
+    print(f"❌ Error: {e}")